@@ -0,0 +1,77 @@
+"""Startup time benchmark for the puzzlemaster cli.
+
+Runs the cli in fresh interpreters and reports the wall time of each run and
+the puzzlemaster modules that were imported by it. The render cache is kept in
+the temporary directory and the renders are forced, so that every run renders
+the puzzle instead of restoring it from the cache.
+
+USAGE:
+    python benchmarks/startup.py [runs]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TWIST = """puzzle: twist
+
+1223
+3114
+4212
+3434
+"""
+
+SKYSCRAPERS = """puzzle: skyscrapers
+
+******
+*****1
+*****2
+*****2
+*****2
+*1222*
+"""
+
+# Runs the cli and prints the imported puzzlemaster modules on the last line of stderr.
+CODE = """
+import sys
+from puzzlemaster.cli import main
+main()
+print(" ".join(m for m in sys.modules if m.startswith("puzzlemaster")), file=sys.stderr)
+"""
+
+def run(args, env):
+    cmd = [sys.executable, "-c", CODE] + args
+    t0 = time.perf_counter()
+    p = subprocess.run(cmd, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - t0
+    if p.returncode != 0:
+        raise Exception(p.stderr)
+    modules = p.stderr.splitlines()[-1].split()
+    return elapsed, modules
+
+def bench(name, args, runs, env):
+    results = [run(args, env) for i in range(runs)]
+    times = sorted(t for t, modules in results)
+    modules = results[-1][1]
+    print("%-24s best %6.1fms  median %6.1fms  modules: %s" % (
+        name, times[0]*1000, times[len(times)//2]*1000, " ".join(sorted(modules))))
+
+def main(runs=10):
+    runs = int(runs)
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, PYTHONPATH=ROOT, PUZZLEMASTER_CACHE=os.path.join(tmp, "cache"))
+        twist = os.path.join(tmp, "twist.txt")
+        skyscrapers = os.path.join(tmp, "skyscrapers.txt")
+        open(twist, "w").write(TWIST)
+        open(skyscrapers, "w").write(SKYSCRAPERS)
+
+        bench("--help", ["--help"], runs, env)
+        bench("solve twist", ["solve", twist], runs, env)
+        bench("render twist", ["render", twist, "--force"], runs, env)
+        bench("render skyscrapers", ["render", skyscrapers, "--force"], runs, env)
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -1,2 +1,7 @@
+"""PuzzleMaster - utility to generate, verify, solve and render puzzles.
 
-import skyscrapers
\ No newline at end of file
+Puzzle modules are imported lazily by the parser registry, see
+puzzlemaster.parser.
+"""
+
+__version__ = "0.1"
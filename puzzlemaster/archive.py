@@ -0,0 +1,118 @@
+"""Writing rendered svg files into a single zip or tar archive.
+
+Creating many small files is slow on network filesystems, so the svg files
+of a batch render can be written as the members of one archive instead,
+through a single buffered file. The members are named after the input
+files, which must map to different members.
+
+With compress, every member of a zip archive is deflated, and every member
+of a tar archive is gzipped and named .svgz, which svg viewers read as is.
+
+    >>> import tempfile
+    >>> filename = os.path.join(tempfile.mkdtemp(), "out.zip")
+    >>> with open_archive(filename, compress=True) as archive:
+    ...     archive.add("puzzles/a.svg", "<svg />")
+    >>> zipfile.ZipFile(filename).namelist()
+    ['puzzles/a.svg']
+"""
+import collections
+import gzip
+import io
+import os
+import tarfile
+import time
+import zipfile
+
+BUFFER_SIZE = 2**20
+
+def member_name(filename):
+    """Returns the name of the archive member for the file, which is a
+    relative path without any ".." parts.
+
+        >>> member_name("/data/../puzzles/./a.svg")
+        'puzzles/a.svg'
+    """
+    parts = os.path.normpath(filename).replace(os.sep, "/").split("/")
+    return "/".join(p for p in parts if p not in ("", ".", ".."))
+
+def duplicate_members(filenames):
+    """Returns the member names shared by more than one of the files.
+
+        >>> duplicate_members(["x.svg", "../x.svg", "y.svg"])
+        ['x.svg']
+    """
+    counts = collections.Counter(member_name(f) for f in filenames)
+    return sorted(name for name, n in counts.items() if n > 1)
+
+class Archive:
+    """Base class of the archives. The subclasses provide add(filename, svg),
+    which adds the svg as the member for filename.
+    """
+    def __init__(self, f, compress=False):
+        self.f = f
+        self.compress = compress
+        self.names = set()
+
+    def member(self, filename):
+        """Returns the member name for filename. Raises ValueError when
+        another file was added with the same member name.
+        """
+        name = member_name(filename)
+        if name in self.names:
+            raise ValueError("duplicate archive member %r for %r" % (name, filename))
+        self.names.add(name)
+        return name
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+class ZipArchive(Archive):
+    def __init__(self, f, compress=False):
+        Archive.__init__(self, f, compress)
+        self.zip = zipfile.ZipFile(f, "w")
+        self.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+
+    def add(self, filename, svg):
+        info = zipfile.ZipInfo(self.member(filename), date_time=time.localtime()[:6])
+        self.zip.writestr(info, svg, compress_type=self.compress_type)
+
+    def close(self):
+        self.zip.close()
+        Archive.close(self)
+
+class TarArchive(Archive):
+    def __init__(self, f, compress=False):
+        Archive.__init__(self, f, compress)
+        self.tar = tarfile.open(fileobj=f, mode="w")
+
+    def add(self, filename, svg):
+        name = self.member(filename)
+        data = svg.encode("utf-8")
+        if self.compress:
+            data = gzip.compress(data, mtime=0)
+            name += "z"
+
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self.tar.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self.tar.close()
+        Archive.close(self)
+
+def open_archive(filename, compress=False):
+    """Returns the Archive to write to filename, which must end with .zip or .tar."""
+    if filename.endswith(".zip"):
+        cls = ZipArchive
+    elif filename.endswith(".tar"):
+        cls = TarArchive
+    else:
+        raise ValueError("unknown archive type %r, expected a .zip or a .tar file" % filename)
+    return cls(open(filename, "wb", buffering=BUFFER_SIZE), compress)
@@ -0,0 +1,149 @@
+"""Compact binary format for the solutions of a puzzle.
+
+Formatting millions of solutions as text takes longer than finding them. In
+the binary format, every solution is packed by its pack method, like the
+digits of a skyscrapers grid in half bytes or the directions of the moves
+of a twist path in bytes, and stored as the length of the prefix it shares
+with the previous solution followed by the rest of it. The solutions found
+one after the other by a depth first search share most of their prefix.
+
+A file starts with MAGIC and the text of the puzzle, which is used to
+unpack the solutions. Each part is preceded by its length as a varint.
+
+    file     := MAGIC varint(len(puzzle)) puzzle record*
+    record   := varint(shared prefix) varint(len(rest)) rest
+
+    >>> import io
+    >>> from puzzlemaster import parser
+    >>> text = "puzzle: twist\\n\\n111\\n111\\n111"
+    >>> f = io.BytesIO()
+    >>> with Writer(f, text) as w:
+    ...     for s in parser.parse(text).solve():
+    ...         w.write(s)
+    >>> len(f.getvalue())
+    102
+    >>> [s.verify() for s in read(io.BytesIO(f.getvalue()))]
+    [[], [], [], [], [], [], [], []]
+"""
+import os
+
+from . import parser, profiling
+
+MAGIC = b"PZSOL1\n"
+
+BUFFER_SIZE = 2**16
+
+def varint(n):
+    """Returns n encoded in 7 bit groups, least significant first.
+
+        >>> varint(5), varint(300)
+        (b'\\x05', b'\\xac\\x02')
+    """
+    out = bytearray()
+    while n >= 0x80:
+        out.append(n & 0x7f | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+def read_varint(data, i):
+    """Returns the varint at data[i:] and the index after it."""
+    n = shift = 0
+    while True:
+        byte = data[i]
+        i += 1
+        n |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return n, i
+        shift += 7
+
+def shared_prefix(a, b):
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+class Writer:
+    """Writes the solutions of a puzzle in the binary format to a binary
+    file, in chunks of atleast buffer_size bytes.
+
+    When append is true, the header is not written and the solutions are
+    added to the solutions already in the file. offset is the size of the
+    file after the last flush, which is saved in the search checkpoints.
+    """
+    def __init__(self, f, puzzle_text, append=False, buffer_size=BUFFER_SIZE):
+        self.f = f
+        self.buffer_size = buffer_size
+        self.buffer = bytearray()
+        self.previous = b""
+        self.count = 0
+        self.offset = f.tell()
+        if not append:
+            text = puzzle_text.encode("utf-8")
+            self.buffer += MAGIC + varint(len(text)) + text
+
+    def write(self, solution):
+        data = solution.pack()
+        prefix = shared_prefix(self.previous, data)
+        self.buffer += varint(prefix) + varint(len(data) - prefix) + data[prefix:]
+        self.previous = data
+        self.count += 1
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        with profiling.stage("write"):
+            self.f.write(self.buffer)
+            self.offset += len(self.buffer)
+            self.buffer.clear()
+            self.f.flush()
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.flush()
+
+def open_writer(filename, puzzle_text, append=False, offset=None):
+    """Returns a Writer to the file. When append is true and the file is not
+    empty, the solutions are added to it, after truncating it to offset when
+    it is given, to drop the solutions written after the checkpoint with that
+    offset.
+    """
+    append = append and os.path.exists(filename) and os.path.getsize(filename) > 0
+    if append and offset is not None:
+        os.truncate(filename, offset)
+    return Writer(open(filename, "ab" if append else "wb"), puzzle_text, append=append)
+
+def decode(data):
+    """Returns the puzzle text and a generator of the packed solutions in the data."""
+    if not data.startswith(MAGIC):
+        raise ValueError("not a puzzlemaster solutions file")
+    n, i = read_varint(data, len(MAGIC))
+    text = data[i:i+n].decode("utf-8")
+    return text, _records(data, i+n)
+
+def _records(data, i):
+    previous = b""
+    while i < len(data):
+        prefix, i = read_varint(data, i)
+        n, i = read_varint(data, i)
+        previous = previous[:prefix] + data[i:i+n]
+        i += n
+        yield previous
+
+def read(f):
+    """Generates the solutions in the binary file f."""
+    text, records = decode(f.read())
+    puzzle = parser.parse(text)
+    for data in records:
+        yield puzzle.unpack_solution(data)
+
+def read_file(filename):
+    with open(filename, "rb") as f:
+        yield from read(f)
@@ -0,0 +1,175 @@
+"""Content-addressed cache of the rendered svg files.
+
+The key of a rendering is the hash of the normalized puzzle text, the render
+style and the package version, so editing the formatting of a puzzle file
+doesn't render it again, while changing the style or upgrading puzzlemaster
+does. The svg files are kept in the cache directory under their key.
+
+When the svg in the cache is the output file itself, as it is after the
+first run since both are hard links of the same file, the rendering is
+skipped without reading or writing the output. Otherwise the output is
+hard-linked from the cache, or copied where hard links are not possible.
+
+The cache is kept under max_size bytes by removing the least recently used
+files. A file is marked used by updating the modification time of the empty
+.used file next to it, not of the svg, which is hard-linked to the outputs.
+
+    >>> import tempfile
+    >>> d = tempfile.mkdtemp()
+    >>> cache = RenderCache(os.path.join(d, "cache"))
+    >>> key = cache.key("puzzle: twist\\n\\n12\\n21")
+    >>> key == cache.key("puzzle:twist\\n\\n12  \\n21\\n")
+    True
+    >>> output = os.path.join(d, "a.svg")
+    >>> cache.restore(key, output) is None
+    True
+    >>> with open(output, "w") as f:
+    ...     n = f.write("<svg/>")
+    >>> cache.put(key, output)
+    >>> os.utime(output, (0, 0))
+    >>> cache.restore(key, output)
+    'unchanged'
+    >>> os.path.getmtime(output)
+    0.0
+    >>> os.remove(output)
+    >>> cache.restore(key, output)
+    'restored'
+"""
+import hashlib
+import json
+import os
+import shutil
+
+from . import __version__
+from .parser import normalize
+
+DEFAULT_MAX_SIZE = 2**30
+
+def default_dir():
+    """Returns $PUZZLEMASTER_CACHE or the puzzlemaster directory in the user's cache directory."""
+    if os.environ.get("PUZZLEMASTER_CACHE"):
+        return os.environ["PUZZLEMASTER_CACHE"]
+    root = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(root, "puzzlemaster")
+
+class RenderCache:
+    def __init__(self, root=None, max_size=DEFAULT_MAX_SIZE):
+        self.root = root or default_dir()
+        self.max_size = max_size
+        self.added = 0
+
+    def key(self, text, style=None):
+        """Returns the key for rendering the puzzle text with the given style."""
+        data = json.dumps([__version__, style or {}, normalize(text)], sort_keys=True)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key + ".svg")
+
+    def touch(self, key):
+        """Marks the cached svg for the key as used."""
+        used = os.path.join(self.root, key[:2], key + ".used")
+        try:
+            os.utime(used)
+        except FileNotFoundError:
+            open(used, "w").close()
+
+    def restore(self, key, filename):
+        """Makes filename the cached svg for the key.
+
+        Returns "unchanged" when filename already is the cached file,
+        "restored" when it is linked or copied from the cache and None when
+        the key is not in the cache.
+        """
+        path = self.path(key)
+        try:
+            if os.path.samefile(path, filename):
+                self.touch(key)
+                return "unchanged"
+        except FileNotFoundError:
+            if not os.path.exists(path):
+                return None
+
+        tmp = filename + ".tmp"
+        try:
+            os.link(path, tmp)
+        except FileNotFoundError:
+            return None
+        except OSError:
+            shutil.copyfile(path, tmp)
+        os.replace(tmp, filename)
+        self.touch(key)
+        return "restored"
+
+    def put(self, key, filename):
+        """Adds the rendered svg file to the cache."""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".%d.tmp" % os.getpid()
+        try:
+            os.link(filename, tmp)
+        except OSError:
+            shutil.copyfile(filename, tmp)
+        os.replace(tmp, path)
+        self.touch(key)
+        self.added += 1
+
+    def get(self, key):
+        """Returns the cached svg for the key as text, or None when it is not in the cache."""
+        path = self.path(key)
+        try:
+            with open(path) as f:
+                svg = f.read()
+        except FileNotFoundError:
+            return None
+        self.touch(key)
+        return svg
+
+    def store(self, key, svg):
+        """Adds the svg text to the cache, for the renders that don't write a file."""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".%d.tmp" % os.getpid()
+        with open(tmp, "w") as f:
+            f.write(svg)
+        os.replace(tmp, path)
+        self.touch(key)
+        self.added += 1
+
+    def entries(self):
+        """Generates (last used time, size, path) of the files in the cache."""
+        if not os.path.isdir(self.root):
+            return
+        for d in os.scandir(self.root):
+            if d.is_dir():
+                files = dict((e.name, e) for e in os.scandir(d.path))
+                for name, e in files.items():
+                    if name.endswith(".svg"):
+                        st = e.stat()
+                        used = files.get(name[:-len(".svg")] + ".used")
+                        # the files cached before the .used files were added
+                        mtime = used.stat().st_mtime if used else st.st_mtime
+                        yield mtime, st.st_size, e.path
+
+    def evict(self):
+        """Removes the least recently used files till the cache is under
+        max_size. Does nothing when no file was added since the last eviction.
+        """
+        if not self.added:
+            return 0
+        self.added = 0
+
+        entries = sorted(self.entries())
+        size = sum(e[1] for e in entries)
+        removed = 0
+        for mtime, file_size, path in entries:
+            if size <= self.max_size:
+                break
+            for p in [path, path[:-len(".svg")] + ".used"]:
+                try:
+                    os.remove(p)
+                except FileNotFoundError:
+                    pass
+            size -= file_size
+            removed += 1
+        return removed
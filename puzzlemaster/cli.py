@@ -1,43 +1,267 @@
-"""Command Line Interface to puzzlemaster"""
+"""Command Line Interface to puzzlemaster
+
+USAGE:
+    puzzlemaster render puzzle1.txt [puzzle2.txt ...] [--compact] [--force] [--no-cache]
+                        [--cache-dir dir] [--cache-size bytes]
+                        [--archive out.zip|out.tar] [--compress] [--jobs N]
+    puzzlemaster solve puzzle.txt [--timeout seconds] [--max-nodes N] [--limit N]
+                                  [--checkpoint file] [--checkpoint-interval seconds]
+                                  [--order name] [--value-order name] [--seed N] [--restarts N]
+                                  [--binary solutions.bin]
+    puzzlemaster solve --resume file
+    puzzlemaster solve twist.txt --count-only [--samples N] [--seed N] [--table-size N]
+    puzzlemaster solve puzzle.txt --jobs N [--timeout seconds] [--limit N] [--order name]
+                                  [--value-order name] [--binary solutions.bin]
+    puzzlemaster decode solutions.bin [--render prefix]
+    puzzlemaster solve-batch skyscrapers1.txt [skyscrapers2.txt ...] [--limit N]
+    puzzlemaster verify solution1.txt [solution2.txt ...]
+    puzzlemaster verify - < solutions.txt
+    puzzlemaster serve [--socket path] [--jobs N]
+    puzzlemaster help
+
+Any command can be profiled by adding --profile prefix [--profile-mode cprofile|tracemalloc],
+which writes the time spent in each stage to prefix.txt, prefix.folded and prefix.files.tsv.
+
+The puzzle modules are not imported here. The parser imports the module for a
+puzzle type only when a puzzle of that type is parsed.
+"""
+import collections
 import sys
 import os.path
+import time
 
-from . import parser
-from . import skyscrapers
-from . import loop
-from . import twist
+from . import parser, profiling
 
 def main():
-    cmd = sys.argv[1]
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "help"
     args = sys.argv[2:]
 
-    commands = dict(render=render, help=help, solve=solve)
-    if cmd in commands:
-        commands[cmd](*args)
-    else:
+    commands = {"render": render, "help": help, "--help": help, "-h": help, "solve": solve, "solve-batch": solve_batch, "verify": verify, "serve": serve, "decode": decode}
+    if cmd not in commands:
         print("unknown command", cmd)
+    elif "--profile" in args:
+        profile(commands[cmd], args)
+    else:
+        commands[cmd](*args)
 
-def render(*puzzle_files):
-    for puzzle_file in puzzle_files:
-        svg = parser.parse_file(puzzle_file).render().tostring()
-        filename = os.path.splitext(puzzle_file)[0] + '.svg'
-        f = open(filename, 'w')
-        f.write(svg)
-        f.close()
-        print('generated', filename)
+def help(*args):
+    print("\n\n".join(__doc__.split("\n\n")[1:3]))
 
-def solve(puzzle_file):
-    puzzle = parser.parse_file(puzzle_file)
+def profile(command, args):
+    """Runs the command with profiling enabled, see puzzlemaster.profiling."""
+    args = list(args)
+    options = {}
+    for name in ["--profile", "--profile-mode"]:
+        if name in args:
+            i = args.index(name)
+            if i+1 == len(args) or args[i+1].startswith("--"):
+                print(f"{name} needs a value, usage: --profile prefix [--profile-mode cprofile|tracemalloc]")
+                sys.exit(1)
+            options[name] = args[i+1]
+            del args[i:i+2]
 
-    solutions = list(puzzle.solve())
+    try:
+        profiling.run(lambda: command(*args), options["--profile"], options.get("--profile-mode"))
+    finally:
+        print("profile written to", options["--profile"] + ".txt", file=sys.stderr)
 
-    count = 0
-    for s in solutions:
-        count += 1
+def render(*args):
+    """Renders the puzzle files to svg files next to them.
+
+    The svg files are cached by the hash of the puzzle, see
+    puzzlemaster.cache, so the puzzles that haven't changed since they were
+    last rendered are skipped. --force renders all of them again and
+    --no-cache doesn't use the cache at all. --compact writes the compact svg,
+    see puzzlemaster.grid.Grid.
+
+    --archive out.zip or out.tar writes the svg files into one archive
+    instead, compressing each of them with --compress. --jobs N renders the
+    puzzles in N processes, while the files are read and written in this
+    one, in the order of the puzzle files.
+    """
+    options, puzzle_files = parse_options(args, flags=["compact", "force", "no_cache", "compress"])
+    style = dict(compact=True) if options.get("compact") else {}
+    cache = None
+    if not options.get("no_cache"):
+        from .cache import RenderCache, DEFAULT_MAX_SIZE
+        cache = RenderCache(options.get("cache_dir"), int(options.get("cache_size") or DEFAULT_MAX_SIZE))
+
+    archive = None
+    if options.get("archive"):
+        from .archive import open_archive, duplicate_members
+        duplicates = duplicate_members(svg_filename(f) for f in puzzle_files)
+        if duplicates:
+            print("more than one puzzle file would be written to " + ", ".join(duplicates) + " in the archive")
+            sys.exit(1)
+        archive = open_archive(options["archive"], compress=options.get("compress"))
+
+    pool = None
+    jobs = options.get("jobs") and int(options["jobs"])
+    if jobs:
+        import concurrent.futures
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+
+    def start(puzzle_file):
+        """Reads the puzzle and returns (key, status, svg), where the svg is
+        None when the output is restored from the cache and a future when it
+        is being rendered in the pool.
+        """
+        with profiling.stage("read"):
+            with open(puzzle_file) as f:
+                text = f.read()
+
+        key = cache and cache.key(text, style)
+        if cache and not options.get("force"):
+            if archive:
+                svg = cache.get(key)
+                if svg is not None:
+                    return key, "cached", svg
+            else:
+                status = cache.restore(key, svg_filename(puzzle_file))
+                if status:
+                    return key, status, None
+
+        if pool:
+            return key, "generated", pool.submit(render_text, text, style)
+        return key, "generated", render_text(text, style)
+
+    def finish(puzzle_file, key, status, svg):
+        """Writes the svg to the archive or to the svg file."""
+        filename = svg_filename(puzzle_file)
+        if pool and status == "generated":
+            svg = svg.result()
+
+        with profiling.file(puzzle_file), profiling.stage("write"):
+            if archive:
+                archive.add(filename, svg)
+                if cache and status == "generated":
+                    cache.store(key, svg)
+            elif status == "generated":
+                # written to a new file, as the old one may be linked from the cache
+                tmp = filename + ".tmp"
+                with open(tmp, 'w') as f:
+                    f.write(svg)
+                os.replace(tmp, filename)
+                if cache:
+                    cache.put(key, filename)
+        print(status, filename)
+
+    # the puzzles being rendered in the pool, in the order of the puzzle files
+    pending = collections.deque()
+    try:
+        for puzzle_file in puzzle_files:
+            with profiling.file(puzzle_file):
+                pending.append((puzzle_file,) + start(puzzle_file))
+                if not pool:
+                    finish(*pending.popleft())
+            while len(pending) > 4 * (jobs or 1):
+                finish(*pending.popleft())
+        while pending:
+            finish(*pending.popleft())
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+        if archive:
+            archive.close()
+
+    if cache:
+        cache.evict()
+
+def svg_filename(puzzle_file):
+    return os.path.splitext(puzzle_file)[0] + '.svg'
+
+def render_text(text, style):
+    """Renders the puzzle text to svg. This runs in the worker processes with --jobs."""
+    return parser.parse(text).render(**style).tostring()
+
+def parse_options(args, flags=()):
+    """Separates the --name value options from the positional arguments.
+    The options named in flags don't take a value.
+
+        >>> parse_options(["a.txt", "--jobs", "4", "b.txt"])
+        ({'jobs': '4'}, ['a.txt', 'b.txt'])
+        >>> parse_options(["--force", "a.txt"], flags=["force"])
+        ({'force': True}, ['a.txt'])
+    """
+    options = {}
+    positional = []
+    args = iter(args)
+    for a in args:
+        if a.startswith("--"):
+            name = a[2:].replace("-", "_")
+            options[name] = True if name in flags else next(args, None)
+        else:
+            positional.append(a)
+    return options, positional
+
+def solve(*args):
+    options, args = parse_options(args, flags=["count_only"])
+    with profiling.file(args[0] if args else options.get("resume")):
+        solve_file(options, args)
+
+def print_solution(s):
+    with profiling.stage("output"):
         print(s)
         print()
 
-    print(f"{count} solutions found")
+def solve_file(options, args):
+    if not options:
+        puzzle = parser.parse_file(args[0])
+        count = 0
+        for s in puzzle.solve_all():
+            count += 1
+            print_solution(s)
+        print(f"{count} solutions found")
+        return
+
+    from . import search
+
+    if "count_only" in options:
+        return count_solutions(args[0], options)
+
+    if "jobs" in options:
+        return solve_parallel(args[0] if args else None, options)
+
+    if "resume" in options:
+        text, state, offset = search.load_checkpoint(options["resume"])
+        options.setdefault("checkpoint", options["resume"])
+    else:
+        text, state, offset = open(args[0]).read(), None, None
+
+    puzzle = parser.parse(text)
+    number = lambda name, type=int: options.get(name) and type(options[name])
+    timeout = number("timeout", float)
+
+    if "restarts" in options:
+        return solve_restarts(puzzle, options, timeout)
+
+    solver = puzzle.solver(**heuristics(options))
+    state = state or search.start(solver)
+
+    writer = None
+    if "binary" in options:
+        from . import binary
+        writer = binary.open_writer(options["binary"], text, append="resume" in options, offset=offset)
+
+    checkpoint = options.get("checkpoint") and search.Checkpoint(
+        options["checkpoint"], text,
+        interval=number("checkpoint_interval", float) or 60,
+        output=writer or sys.stdout)
+
+    output = writer.write if writer else print_solution
+    for s in search.iterate(solver, state,
+            limit=number("limit"),
+            max_nodes=number("max_nodes"),
+            deadline=timeout and time.time() + timeout,
+            checkpoint=checkpoint):
+        output(s)
+
+    if writer:
+        writer.close()
+
+    print(f"{state.solutions} solutions found")
+    if not state.done:
+        print(f"search stopped after {state.nodes} nodes")
 
     """
     filename = os.path.splitext(puzzle_file)[0] + '-s.svg'
@@ -47,5 +271,157 @@ def solve(puzzle_file):
     print 'generated', filename
     """
 
+def decode(*args):
+    """Prints the solutions in a file written by solve --binary, or renders
+    them to prefix-1.svg, prefix-2.svg, ... with --render prefix.
+    """
+    from . import binary
+
+    options, args = parse_options(args)
+    for i, s in enumerate(binary.read_file(args[0]), 1):
+        if "render" in options:
+            s.render().save(f"{options['render']}-{i}.svg")
+        else:
+            print_solution(s)
+
+def count_solutions(puzzle_file, options):
+    """Counts the solutions without enumerating them and prints --samples
+    of them chosen uniformly at random. See puzzlemaster.twist.TwistCounter.
+    """
+    import random
+
+    puzzle = parser.parse_file(puzzle_file)
+    if not hasattr(puzzle, "counter"):
+        print(f"counting the solutions is not supported for {puzzle.__class__.__name__} puzzles")
+        sys.exit(1)
+
+    counter = puzzle.counter(int(options.get("table_size") or 2**20))
+    with profiling.stage("count"):
+        count = counter.count()
+
+    rng = random.Random(options.get("seed") and int(options["seed"]))
+    for i in range(int(options.get("samples") or 0)):
+        s = counter.sample(rng)
+        if s is None:
+            break
+        print_solution(s)
+    print(f"{count} solutions found")
+
+def heuristics(options):
+    """Returns the branching heuristics given by the --order, --value-order
+    and --seed options. See the solvers of the puzzles for the choices.
+    """
+    h = dict((name, options[name]) for name in ["order", "value_order"] if name in options)
+    if "seed" in options:
+        h["seed"] = int(options["seed"])
+    return h
+
+def solve_restarts(puzzle, options, timeout):
+    """Solves the puzzle restarting the search after --restarts times the
+    Luby sequence of nodes, see puzzlemaster.search.run_restarts.
+    """
+    from . import search
+
+    result = search.solve(puzzle,
+        limit=options.get("limit") and int(options["limit"]),
+        max_nodes=options.get("max_nodes") and int(options["max_nodes"]),
+        timeout=timeout,
+        heuristics=heuristics(options),
+        restarts=int(options["restarts"]))
+
+    for s in result.solutions:
+        print_solution(s)
+    print(f"{len(result.solutions)} solutions found")
+    if not result.complete:
+        print(f"search stopped after {result.state.nodes} nodes")
+
+# the options of solve that can't be used with --jobs
+PARALLEL_UNSUPPORTED = ["max_nodes", "checkpoint", "resume", "restarts"]
+
+def solve_parallel(puzzle_file, options):
+    """Solves the puzzle using --jobs processes. The solutions are printed in
+    the order they are found, which may differ from the sequential search.
+    """
+    from . import parallel
+
+    unsupported = [name for name in PARALLEL_UNSUPPORTED if name in options]
+    if unsupported:
+        print("--jobs can't be used with " + ", ".join("--" + name.replace("_", "-") for name in unsupported))
+        sys.exit(1)
+
+    text = open(puzzle_file).read()
+    timeout = options.get("timeout") and float(options["timeout"])
+    solutions = parallel.solve(text,
+        jobs=int(options["jobs"]),
+        limit=options.get("limit") and int(options["limit"]),
+        deadline=timeout and time.time() + timeout,
+        heuristics=heuristics(options))
+
+    writer = None
+    if "binary" in options:
+        from . import binary
+        writer = binary.open_writer(options["binary"], text)
+
+    output = writer.write if writer else print_solution
+    count = 0
+    for s in solutions:
+        count += 1
+        output(s)
+
+    if writer:
+        writer.close()
+    print(f"{count} solutions found")
+
+def solve_batch(*args):
+    """Solves many skyscrapers puzzles at once using the NumPy batch solver."""
+    from . import skyscrapers_batch
+
+    options, puzzle_files = parse_options(args)
+    puzzles = [parser.parse_file(f) for f in puzzle_files]
+    limit = options.get("limit") and int(options["limit"])
+
+    for puzzle_file, solutions in zip(puzzle_files, skyscrapers_batch.solve_batch(puzzles, limit=limit)):
+        for s in solutions:
+            print(s)
+            print()
+        print(f"{puzzle_file}: {len(solutions)} solutions found")
+
+def verify(*solution_files):
+    """Verifies the solutions without solving the puzzles.
+
+    A "-" reads a stream of solutions from stdin, each starting with its
+    "puzzle:" header. Exits with status 1 if any solution is invalid.
+    """
+    from .verify import verify_stream
+
+    def results():
+        for filename in solution_files:
+            if filename == "-":
+                f, filename = sys.stdin, "<stdin>"
+            else:
+                f = open(filename)
+            with profiling.file(filename):
+                for lineno, problems in verify_stream(f):
+                    yield (filename if lineno == 1 else f"{filename}:{lineno}"), problems
+
+    invalid = 0
+    for name, problems in results():
+        if problems:
+            invalid += 1
+            print(f"{name}: invalid: " + "; ".join(problems))
+        else:
+            print(f"{name}: ok")
+
+    if invalid:
+        sys.exit(1)
+
+def serve(*args):
+    """Runs the server, reading requests from stdin or from a unix socket."""
+    from . import server
+
+    options, _ = parse_options(args)
+    jobs = options.get("jobs")
+    server.Server(jobs=jobs and int(jobs)).run(socket=options.get("socket"))
+
 if __name__ == "__main__":
     main()
@@ -2,18 +2,64 @@
 
 from __future__ import with_statement
 
-from .svg import SVG
+from .svg import SVG, GEOMETRY
+
+def number(x):
+    """Formats a coordinate with atmost 2 decimals.
+
+        >>> number(150.0), number(20.000000000000004), number(-25)
+        ('150', '20', '-25')
+    """
+    return ("%.2f" % x).rstrip("0").rstrip(".")
 
 class Grid:
-    def __init__(self, width, height):
+    """Grid of width x height cells, each 100 units wide.
+
+    In the compact mode, the presentation attributes are declared once as CSS
+    classes and every distinct text and corner is declared once in the
+    <defs> and placed with <use>, which makes the svg of large grids several
+    times smaller.
+
+        >>> g = Grid(1, 1, compact=True)
+        >>> g.text(0, 0, 1)
+        >>> g.text(0, 1, 1)
+        >>> print(g.svg.tostring())
+        <svg width="300" height="300" xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink">
+          <defs>
+            <style>.c0{font-family:Courier;font-size:48px;font-weight:bold;dominant-baseline: central;text-anchor:middle}</style>
+            <text id="d0" class="c0">1</text>
+          </defs>
+          <g transform="translate(100, 100)">
+            <use xlink:href="#d0" x="50" y="65" />
+            <use xlink:href="#d0" x="50" y="165" />
+          </g>
+        </svg>
+        <BLANKLINE>
+    """
+    def __init__(self, width, height, compact=False):
         self.width = width
         self.height = height
 
         w = self.width*100 + 200
         h = self.height*100 + 200
         self.svg = SVG(width=w, height=h)
+        self.defs = compact and self.svg.add_defs()
         self.canvas = self.svg.translate(100, 100)
 
+    def element(self, tag, **attrs):
+        """Adds an element to the canvas. In the compact mode, the
+        presentation attributes are replaced by a CSS class.
+        """
+        if self.defs:
+            style = dict((k, attrs.pop(k)) for k in list(attrs) if k not in GEOMETRY)
+            if style:
+                attrs["class"] = self.defs.css_class(**style)
+        return self.canvas.node(tag, **attrs)
+
+    def use(self, x, y, tag, text=None, **attrs):
+        """Places the element declared in the defs at (x, y)."""
+        self.canvas.use(self.defs.symbol(tag, text, **attrs), x=number(x), y=number(y))
+
     def hline(self, x, y, width, **attrs):
         self.line(x, y, x+width, y, **attrs)
 
@@ -21,14 +67,21 @@ class Grid:
         self.line(x, y, x, y+height, **attrs)
 
     def line(self, x1, y1, x2, y2, **attrs):
-        self.canvas.line(x1=x1*100, y1=y1*100, x2=x2*100, y2=y2*100, **attrs)
+        if self.defs:
+            # lines of the same length and direction differ only in the position
+            self.use(x1*100, y1*100, "line", x2=number((x2-x1)*100), y2=number((y2-y1)*100), **attrs)
+        else:
+            self.element("line", x1=x1*100, y1=y1*100, x2=x2*100, y2=y2*100, **attrs)
 
     def rect(self, x, y, width, height, **attrs):
-        self.canvas.rect(x=x*100, y=y*100, width=width*100, height=height*100, **attrs)
+        self.element("rect", x=x*100, y=y*100, width=width*100, height=height*100, **attrs)
 
     def circle(self, cx, cy, r, **attrs):
         cx, cy = cx*100, cy*100
-        self.canvas.circle(cx=cx, cy=cy, r=r, **attrs)
+        if self.defs:
+            self.use(cx, cy, "circle", r=r, **attrs)
+        else:
+            self.canvas.circle(cx=cx, cy=cy, r=r, **attrs)
 
     def draw_grid(self, **attrs):
         # draw vertical lines
@@ -54,7 +107,10 @@ class Grid:
         yoffset = attrs.pop('yoffset', 65)
 
         x, y = x*100+xoffset, y*100+yoffset
-        self.canvas.text(x=x, y=y, **attrs)(text)
+        if self.defs:
+            self.use(x, y, "text", str(text), **attrs)
+        else:
+            self.canvas.text(x=x, y=y, **attrs)(text)
 
     def draw_numbers(self, data, **attrs):
         """Draw numbers in each cell.
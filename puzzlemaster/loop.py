@@ -1,7 +1,7 @@
 """Loop Puzzle.
 """
 
-from . import parser
+from . import parser, profiling
 from .grid import Grid
 
 class LoopParser:
@@ -26,8 +26,9 @@ class Loop:
     def loads(text):
         return LoopParser().parse(text.splitlines())
 
-    def render(self):
-        grid = Grid(self.cols, self.rows)
+    @profiling.timed("draw")
+    def render(self, compact=False):
+        grid = Grid(self.cols, self.rows, compact)
         grid.draw_corners(r=6)
         grid.draw_grid(stroke_dasharray="4 4", stroke="black", stroke_width=1)
 
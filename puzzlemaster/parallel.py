@@ -0,0 +1,107 @@
+"""Parallel search using multiple processes.
+
+The top levels of the search tree are expanded breadth first till there are
+enough subtrees to keep all the workers busy. Each subtree is searched in a
+worker process for atmost slice_nodes nodes. If the subtree is not done by
+then, the remaining part of it is split again and put back in the queue, so
+that idle workers can pick up the parts of a large subtree instead of
+waiting for the worker that got it.
+
+Every pending move of a search is an independent subtree, so the subtrees
+searched by the workers together cover the same tree as the sequential search
+and find the same solutions, though not in the same order.
+"""
+import collections
+import concurrent.futures
+import os
+import time
+
+from . import parser, search
+
+def split(solver, count):
+    """Expands the search tree breadth first till there are atleast count
+    pending moves or the tree is exhausted.
+
+    Returns the solutions found while expanding and the pending moves.
+    """
+    solutions = []
+    moves = collections.deque(solver.root())
+    while moves and len(moves) < count:
+        solution, children = solver.expand(moves.popleft())
+        if solution is not None:
+            solutions.append(solver.make_solution(solution))
+        moves.extend(children or [])
+    return solutions, list(moves)
+
+def split_state(state):
+    """Splits the remaining work of a search into independent states.
+
+    The moves at the lowest level of the stack are the roots of the largest
+    subtrees, so each of them becomes a separate state and the rest of the
+    stack is kept together.
+    """
+    stack = [frame for frame in state.stack if frame]
+    if not stack:
+        return []
+
+    bottom, rest = stack[0], stack[1:]
+    states = [search.SearchState(rest)] if rest else []
+    states += [search.SearchState([[move]]) for move in reversed(bottom)]
+    return states
+
+# solver of the puzzle being solved in this worker process
+_solver = {}
+
+def get_solver(text, heuristics):
+    key = text, tuple(sorted(heuristics.items()))
+    if key not in _solver:
+        _solver.clear()
+        _solver[key] = parser.parse(text).solver(**heuristics)
+    return _solver[key]
+
+def run_task(text, heuristics, state, slice_nodes, deadline):
+    """Searches the state for atmost slice_nodes nodes. This runs in the worker processes."""
+    result = search.run(get_solver(text, heuristics), state, max_nodes=slice_nodes, deadline=deadline)
+    return result.solutions, split_state(result.state), result.status
+
+def solve(text, jobs=None, limit=None, deadline=None, slice_nodes=20000, tasks_per_job=8, heuristics=None):
+    """Generates the solutions of the puzzle using jobs worker processes.
+
+    The puzzle is passed as text, so that the workers can parse it. The
+    solutions are generated in the order the workers find them. The
+    heuristics are passed to the solver of the puzzle.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    heuristics = heuristics or {}
+    solver = parser.parse(text).solver(**heuristics)
+    solutions, moves = split(solver, jobs * tasks_per_job)
+
+    count = 0
+    for s in solutions:
+        if limit is not None and count >= limit:
+            return
+        count += 1
+        yield s
+
+    queue = collections.deque(search.SearchState([[move]]) for move in moves)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        running = set()
+        try:
+            while queue or running:
+                while queue and len(running) < 2*jobs:
+                    running.add(pool.submit(run_task, text, heuristics, queue.popleft(), slice_nodes, deadline))
+
+                done, running = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for f in done:
+                    solutions, states, status = f.result()
+                    for s in solutions:
+                        if limit is not None and count >= limit:
+                            return
+                        count += 1
+                        yield s
+                    if status == "deadline" or (deadline is not None and time.time() >= deadline):
+                        return
+                    queue.extend(states)
+        finally:
+            for f in running:
+                f.cancel()
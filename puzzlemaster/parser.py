@@ -5,15 +5,81 @@
 
 import itertools
 
-_puzzle_registry = {}
+from . import profiling
+
+# Entry point group used by third-party packages to provide new puzzle types.
+# The name of the entry point is the puzzle name used in the "puzzle:" header.
+ENTRY_POINT_GROUP = "puzzlemaster.puzzles"
+
+# Maps puzzle name to either the puzzle class or a "module:class" string.
+# The strings are imported on first use, so that the cli doesn't have to pay
+# for importing every puzzle module on every invocation.
+_puzzle_registry = {
+    "loop": "puzzlemaster.loop:Loop",
+    "skyscrapers": "puzzlemaster.skyscrapers:SkyScrappers",
+    "twist": "puzzlemaster.twist:Twist",
+    "twist-solution": "puzzlemaster.twist:TwistSolution",
+}
 
 def register_puzzle(name, cls):
+    """Registers a puzzle type.
+
+    cls can either be the puzzle class or a "module:class" string, which is
+    imported only when a puzzle of that type is parsed.
+    """
     _puzzle_registry[name] = cls
-    
+
+def import_object(path):
+    """Imports an object from a "module:name" string.
+
+        >>> import_object("puzzlemaster.utils:matrix2str")([[1, 2]])
+        '12'
+    """
+    import importlib
+    modname, _, objname = path.partition(":")
+    obj = importlib.import_module(modname)
+    for name in objname.split("."):
+        obj = getattr(obj, name)
+    return obj
+
+def _find_entry_point(name):
+    from importlib.metadata import entry_points
+    for ep in entry_points(group=ENTRY_POINT_GROUP):
+        if ep.name == name:
+            return ep.value
+
+def get_puzzle_class(name):
+    """Returns the puzzle class registered for the given name.
+
+    Puzzle types not in the registry are looked up in the entry points of the
+    installed packages.
+    """
+    cls = _puzzle_registry.get(name) or _find_entry_point(name)
+    if cls is None:
+        raise KeyError(name)
+    if isinstance(cls, str):
+        cls = import_object(cls)
+        _puzzle_registry[name] = cls
+    return cls
+
 def split_kv(line):
     k, v = line.split(":", 1)
     return k.strip(), v.strip()
 
+def normalize(data):
+    r"""Returns the puzzle text in a normal form, with the headers sorted and
+    the trailing whitespace removed, so that the texts differing only in
+    formatting have the same normal form.
+
+        >>> normalize("puzzle:twist\n\n12  \n21\n\n")
+        'puzzle: twist\n\n12\n21'
+    """
+    lines = (line.rstrip() for line in data.splitlines())
+    headers = sorted(split_kv(line) for line in itertools.takewhile(lambda line: line, lines))
+    body = "\n".join(lines).rstrip("\n")
+    return "".join("%s: %s\n" % kv for kv in headers) + "\n" + body
+
+@profiling.timed("parse")
 def parse(data):
     headers = []
     body = []
@@ -24,11 +90,13 @@ def parse(data):
     body = "\n".join(lines)
     
     puzzle = headers['puzzle']
-    return _puzzle_registry[puzzle].loads(body)
+    return get_puzzle_class(puzzle).loads(body)
     
     
 def parse_file(filename):
-    return parse(open(filename).read())
+    with profiling.stage("read"):
+        data = open(filename).read()
+    return parse(data)
 
 def parse_grid(lines):
     d = {}
@@ -40,4 +108,4 @@ def parse_grid(lines):
 
 if __name__ == '__main__':
     import doctest
-    doctest.testmod()
\ No newline at end of file
+    doctest.testmod()
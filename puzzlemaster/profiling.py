@@ -0,0 +1,236 @@
+"""Profiling the stages of the puzzlemaster pipeline.
+
+The stages, like parsing, solving, drawing and converting the svg to
+string, are marked using stage or timed. They do nothing unless profiling is
+enabled using start, so they can stay in the hot paths.
+
+    with profiling.stage("indent"):
+        self._indent(e)
+
+When enabled, the wall time and the change in the number of allocated memory
+blocks are recorded for every stage, nested stages included, separately for
+every file being processed. The blocks are the net change, the blocks
+allocated minus the blocks freed, so a stage that frees more than it
+allocates has a negative count. Use the tracemalloc mode of run to see the
+allocations themselves.
+
+    >>> p = start()
+    >>> with file("a.txt"):
+    ...     with stage("render"):
+    ...         with stage("draw"):
+    ...             pass
+    >>> stop() is p
+    True
+    >>> sorted(path for f, path in p.records)
+    [('render',), ('render', 'draw')]
+"""
+import functools
+import sys
+import time
+
+class NoStage:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, type, value, traceback):
+        pass
+
+_nostage = NoStage()
+
+# The active Profile, None when profiling is not enabled.
+_profile = None
+
+class Stage:
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.profile.stack.append([self.name, 0.0])
+        self.blocks = sys.getallocatedblocks()
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, type, value, traceback):
+        elapsed = time.perf_counter() - self.t0
+        blocks = sys.getallocatedblocks() - self.blocks
+
+        stack = self.profile.stack
+        path = tuple(name for name, _ in stack)
+        children = stack.pop()[1]
+        if stack:
+            stack[-1][1] += elapsed
+
+        key = self.profile.current_file, path
+        record = self.profile.records.get(key)
+        if record is None:
+            record = self.profile.records[key] = [0, 0.0, 0.0, 0]
+        record[0] += 1
+        record[1] += elapsed
+        record[2] += elapsed - children
+        record[3] += blocks
+
+class Profile:
+    """Per file and per stage records of calls, total time, self time and the
+    net change in allocated blocks."""
+    def __init__(self):
+        self.records = {}
+        self.stack = []
+        self.current_file = None
+
+    def stage(self, name):
+        return Stage(self, name)
+
+    def aggregate(self):
+        """Returns the records of all the files added up for each stage."""
+        totals = {}
+        for (filename, path), record in self.records.items():
+            total = totals.setdefault(path, [0, 0.0, 0.0, 0])
+            for i, x in enumerate(record):
+                total[i] += x
+        return totals
+
+    def files(self):
+        return sorted(set(f for f, path in self.records))
+
+    def file_times(self):
+        """Returns the total time of the top-level stages for every file."""
+        times = {}
+        for (filename, path), record in self.records.items():
+            if len(path) == 1:
+                times[filename] = times.get(filename, 0.0) + record[1]
+        return times
+
+    def report(self, slowest=10):
+        lines = ["%-40s %8s %12s %12s %12s" % ("stage", "calls", "total ms", "self ms", "net blocks")]
+        for path, (calls, total, self_time, blocks) in sorted(self.aggregate().items()):
+            name = "  " * (len(path)-1) + path[-1]
+            lines.append("%-40s %8d %12.2f %12.2f %12d" % (name, calls, total*1000, self_time*1000, blocks))
+
+        times = self.file_times()
+        if times:
+            lines.append("")
+            lines.append("%d files, %.2f ms per file. slowest files:" % (len(times), 1000*sum(times.values())/len(times)))
+            for filename in sorted(times, key=times.get, reverse=True)[:slowest]:
+                lines.append("  %10.2f ms  %s" % (times[filename]*1000, filename))
+        return "\n".join(lines) + "\n"
+
+    def collapsed(self):
+        """Returns the self time of every stage in microseconds in the
+        collapsed stack format read by flamegraph.pl and speedscope.
+        """
+        return "".join("%s %d\n" % (";".join(path), round(record[2] * 1e6))
+                       for path, record in sorted(self.aggregate().items()))
+
+    def file_records(self):
+        """Returns the records as tab separated lines, one line per file and stage."""
+        lines = ["file\tstage\tcalls\ttotal_ms\tself_ms\tnet_blocks"]
+        for (filename, path), (calls, total, self_time, blocks) in sorted(self.records.items(), key=lambda item: (str(item[0][0]), item[0][1])):
+            lines.append("%s\t%s\t%d\t%.3f\t%.3f\t%d" % (filename, ";".join(path), calls, total*1000, self_time*1000, blocks))
+        return "\n".join(lines) + "\n"
+
+def start():
+    global _profile
+    _profile = Profile()
+    return _profile
+
+def stop():
+    global _profile
+    p, _profile = _profile, None
+    return p
+
+def stage(name):
+    """Returns a context manager to time a stage."""
+    if _profile is None:
+        return _nostage
+    return _profile.stage(name)
+
+def timed(name):
+    """Decorator to time every call to the function as a stage."""
+    def decorator(f):
+        @functools.wraps(f)
+        def g(*args, **kwargs):
+            if _profile is None:
+                return f(*args, **kwargs)
+            with _profile.stage(name):
+                return f(*args, **kwargs)
+        return g
+    return decorator
+
+def timed_iter(name, iterator):
+    """Times every step of the iterator as a stage. The return value of a
+    generator is passed through.
+    """
+    if _profile is None:
+        return iterator
+    return _timed_iter(name, iterator)
+
+def _timed_iter(name, iterator):
+    while True:
+        with stage(name):
+            try:
+                x = next(iterator)
+            except StopIteration as e:
+                return e.value
+        yield x
+
+class File:
+    def __init__(self, filename):
+        self.filename = filename
+
+    def __enter__(self):
+        self.previous = _profile.current_file
+        _profile.current_file = self.filename
+
+    def __exit__(self, type, value, traceback):
+        _profile.current_file = self.previous
+
+def file(filename):
+    """Returns a context manager to record the stages under the given file."""
+    if _profile is None:
+        return _nostage
+    return File(filename)
+
+def run(func, prefix, mode=None):
+    """Runs func with profiling enabled and writes the reports.
+
+    Writes the aggregate report to prefix.txt, the collapsed stacks to
+    prefix.folded and the per file records to prefix.files.tsv. The mode
+    "cprofile" also writes the cProfile stats to prefix.pstats and the mode
+    "tracemalloc" adds the top allocation sites to the report. The reports
+    are written even when func raises an exception or calls sys.exit.
+    """
+    profiler = None
+    if mode == "cprofile":
+        import cProfile
+        profiler = cProfile.Profile()
+    elif mode == "tracemalloc":
+        import tracemalloc
+        tracemalloc.start()
+
+    p = start()
+    try:
+        if profiler:
+            profiler.runcall(func)
+        else:
+            func()
+    finally:
+        stop()
+        write_reports(p, prefix, mode, profiler)
+    return p
+
+def write_reports(p, prefix, mode=None, profiler=None):
+    report = p.report()
+    if profiler:
+        profiler.dump_stats(prefix + ".pstats")
+    elif mode == "tracemalloc":
+        import tracemalloc
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        report += "\ntop allocation sites:\n" + "".join("  %s\n" % stat for stat in snapshot.statistics("lineno")[:20])
+
+    with open(prefix + ".txt", "w") as f:
+        f.write(report)
+    with open(prefix + ".folded", "w") as f:
+        f.write(p.collapsed())
+    with open(prefix + ".files.tsv", "w") as f:
+        f.write(p.file_records())
@@ -0,0 +1,407 @@
+"""Resumable depth first search with time and node budgets.
+
+The solvers describe their search tree using two methods:
+
+    root()          - returns the list of moves at the root of the tree
+    expand(move)    - makes the move and returns (solution, moves), where
+                      solution is the solution reached by the move or None and
+                      moves is the list of moves from the new node.
+
+The search keeps a stack of pending moves instead of recursing, so it can be
+stopped after any node and continued later from the saved SearchState.
+
+    >>> from puzzlemaster import parser
+    >>> puzzle = parser.parse("puzzle: twist\\n\\n1223\\n3114\\n4212\\n3434")
+    >>> result = solve(puzzle, max_nodes=5)
+    >>> result.status, len(result.solutions)
+    ('nodes', 0)
+    >>> result = solve(puzzle, state=result.state)
+    >>> result.status, len(result.solutions), result.state.nodes
+    ('complete', 1, 47)
+"""
+import collections
+import itertools
+import os
+import time
+
+from . import profiling
+
+# the cancel event of a search is checked once in every CANCEL_CHECK_NODES nodes
+CANCEL_CHECK_NODES = 1000
+
+class SearchState:
+    """Position of a search, which can be used to continue the search.
+
+    The stack has a list of pending moves for each level of the search tree.
+    The moves are kept in reverse order, so that the next move is at the end.
+    """
+    def __init__(self, stack, nodes=0, solutions=0):
+        self.stack = stack
+        self.nodes = nodes
+        self.solutions = solutions
+
+    @property
+    def done(self):
+        return not self.stack
+
+    def __repr__(self):
+        return "<SearchState: depth=%d nodes=%d solutions=%d>" % (len(self.stack), self.nodes, self.solutions)
+
+class SearchResult:
+    """Result of a budgeted search.
+
+    The status is one of "complete", "limit", "nodes", "deadline" or
+    "cancelled" telling why the search stopped. Unless it is complete, the
+    search can be continued by passing the state to solve again.
+    """
+    def __init__(self, solutions, state, status):
+        self.solutions = solutions
+        self.state = state
+        self.status = status
+
+    @property
+    def complete(self):
+        return self.status == "complete"
+
+    def __repr__(self):
+        return "<SearchResult: %s, %d solutions>" % (self.status, len(self.solutions))
+
+def start(solver):
+    return SearchState([list(reversed(solver.root()))])
+
+def step(solver, state):
+    """Expands the next node of the search. Returns the solution found at that node or None."""
+    stack = state.stack
+    while stack and not stack[-1]:
+        stack.pop()
+    if not stack:
+        return None
+
+    solution, moves = solver.expand(stack[-1].pop())
+    state.nodes += 1
+    if moves:
+        stack.append(list(reversed(moves)))
+    if solution is not None:
+        state.solutions += 1
+    return solution
+
+def iterate(solver, state=None, limit=None, max_nodes=None, deadline=None, checkpoint=None, cancel=None):
+    """Generates the solutions found by the solver till the search is complete
+    or any of the budgets is exhausted.
+
+    limit is the maximum number of solutions to generate, max_nodes is the
+    maximum number of nodes to expand and deadline is the time, as given by
+    time.time(), at which the search is stopped. The reason for stopping is
+    the return value of the generator.
+
+    cancel is an event, like a threading.Event or a
+    multiprocessing.Manager().Event(), that stops the search when it is set.
+    It is checked once in every CANCEL_CHECK_NODES nodes, as checking a
+    manager's event takes a round trip to the manager process.
+
+    When a Checkpoint is given, the state is saved to it periodically. The
+    state is saved only after the solutions generated so far are consumed, so
+    a search resumed from the checkpoint doesn't generate them again.
+    """
+    return profiling.timed_iter("solve", _iterate(solver, state, limit, max_nodes, deadline, checkpoint, cancel))
+
+def _iterate(solver, state=None, limit=None, max_nodes=None, deadline=None, checkpoint=None, cancel=None):
+    state = state or start(solver)
+    stack = state.stack
+    expand = solver.expand
+    max_nodes = max_nodes and state.nodes + max_nodes
+    # the budgets other than limit are checked at every node only when given
+    budgeted = max_nodes is not None or deadline is not None or cancel is not None
+    next_cancel_check = state.nodes
+    count = 0
+
+    while True:
+        while stack and not stack[-1]:
+            stack.pop()
+        if not stack:
+            status = "complete"
+            break
+        if limit is not None and count >= limit:
+            status = "limit"
+            break
+        if budgeted:
+            if max_nodes is not None and state.nodes >= max_nodes:
+                status = "nodes"
+                break
+            if deadline is not None and time.time() >= deadline:
+                status = "deadline"
+                break
+            if cancel is not None and state.nodes >= next_cancel_check:
+                if cancel.is_set():
+                    status = "cancelled"
+                    break
+                next_cancel_check = state.nodes + CANCEL_CHECK_NODES
+
+        # step, inlined as this is the inner loop of every search
+        solution, moves = expand(stack[-1].pop())
+        state.nodes += 1
+        if moves:
+            stack.append(moves[::-1])
+        if solution is not None:
+            state.solutions += 1
+            count += 1
+            yield solver.make_solution(solution)
+        if checkpoint is not None and state.nodes >= checkpoint.next_nodes:
+            checkpoint.update(state)
+
+    if checkpoint is not None:
+        checkpoint.save(state)
+    return status
+
+def run(solver, state=None, limit=None, max_nodes=None, deadline=None, checkpoint=None, cancel=None):
+    """Runs the search till it is complete or any of the budgets is exhausted.
+
+    See iterate for the arguments.
+    """
+    state = state or start(solver)
+    solutions = []
+    it = iterate(solver, state, limit=limit, max_nodes=max_nodes, deadline=deadline,
+                 checkpoint=checkpoint, cancel=cancel)
+    while True:
+        try:
+            solutions.append(next(it))
+        except StopIteration as e:
+            return SearchResult(solutions, state, e.value)
+
+def _deadline(deadline, timeout):
+    if timeout is not None:
+        t = time.time() + timeout
+        deadline = t if deadline is None else min(deadline, t)
+    return deadline
+
+def luby(i):
+    """Returns the i-th term of the Luby sequence, counting from 1.
+
+        >>> [luby(i) for i in range(1, 16)]
+        [1, 1, 2, 1, 1, 2, 4, 1, 1, 2, 1, 1, 2, 4, 8]
+    """
+    k = i.bit_length()
+    while i != 2**k - 1:
+        i -= 2**(k-1) - 1
+        k = i.bit_length()
+    return 2**(k-1)
+
+def run_restarts(make_solver, scale=100, limit=None, max_nodes=None, deadline=None, cancel=None):
+    """Runs the search with restarts.
+
+    The time to search a randomized solver often has a heavy tail, where a
+    few unlucky early choices lead into a huge subtree without solutions.
+    The search is restarted with a new seed after scale * luby(i) nodes in
+    the i-th run, so a bad run is given up early, while the growing cutoffs
+    make sure that the search eventually completes.
+
+    make_solver(i) returns the solver to use in the i-th run. The solutions
+    found again in a later run are generated only once. The state of the
+    result is the state of the last run.
+    """
+    solutions = []
+    seen = set()
+    nodes = 0
+    for i in itertools.count(1):
+        cutoff = scale * luby(i)
+        if max_nodes is not None:
+            cutoff = min(cutoff, max_nodes - nodes)
+        # a run finds distinct solutions, so finding limit of them gives enough new ones
+        result = run(make_solver(i), limit=limit, max_nodes=cutoff, deadline=deadline, cancel=cancel)
+        nodes += result.state.nodes
+
+        for s in result.solutions:
+            if str(s) not in seen:
+                seen.add(str(s))
+                solutions.append(s)
+
+        if limit is not None and len(solutions) >= limit:
+            status = "limit"
+            break
+        if result.status in ("complete", "deadline", "cancelled"):
+            status = result.status
+            break
+        if max_nodes is not None and nodes >= max_nodes:
+            status = "nodes"
+            break
+
+    result.state.nodes = nodes
+    return SearchResult(solutions[:limit], result.state, status)
+
+def solve(puzzle, limit=None, max_nodes=None, deadline=None, timeout=None, state=None,
+          heuristics=None, restarts=None, cancel=None):
+    """Solves the puzzle within the given budget, or till the cancel event
+    is set, see iterate.
+
+    Pass the state of a previous result to continue that search. The
+    heuristics are passed to puzzle.solver to choose the branching order of
+    the search. When restarts is given, the search is restarted with random
+    tie breaking as in run_restarts, with restarts as the scale. What the
+    solver of a run has learned, as given by its learned method, like the
+    failure weights of domwdeg, is passed on to the solver of the next run.
+
+        >>> from puzzlemaster import parser
+        >>> puzzle = parser.parse("puzzle: twist\\n\\n1223\\n3114\\n4212\\n3434")
+        >>> solve(puzzle, heuristics=dict(order="fewest"), restarts=10)
+        <SearchResult: complete, 1 solutions>
+    """
+    deadline = _deadline(deadline, timeout)
+    heuristics = heuristics or {}
+    if restarts:
+        seed = heuristics.get("seed") or 0
+        learned = {}
+        def make_solver(i):
+            solver = puzzle.solver(**dict(heuristics, seed=seed + i, **learned))
+            if hasattr(solver, "learned"):
+                learned.update(solver.learned())
+            return solver
+        return run_restarts(make_solver, restarts, limit=limit, max_nodes=max_nodes, deadline=deadline,
+                            cancel=cancel)
+    return run(puzzle.solver(**heuristics), state, limit=limit, max_nodes=max_nodes, deadline=deadline,
+               cancel=cancel)
+
+async def solve_async(puzzle, limit=None, max_nodes=None, deadline=None, timeout=None, state=None,
+                      slice_nodes=1000, executor=None, heuristics=None, cancel=None):
+    """Asyncio version of solve.
+
+    The search is run in the executor in slices of slice_nodes nodes, so it
+    doesn't block the event loop and many searches can make progress at the
+    same time. Cancelling the task stops the search after the current slice.
+    The executor can be a process pool, in which case the cancel event must
+    be one that can be passed to the workers, like a manager's event.
+    """
+    # imported here as importing asyncio takes longer than starting the cli
+    import asyncio
+
+    deadline = _deadline(deadline, timeout)
+    solver = puzzle.solver(**(heuristics or {}))
+    state = state or start(solver)
+    max_nodes = max_nodes and state.nodes + max_nodes
+    loop = asyncio.get_running_loop()
+    solutions = []
+
+    while True:
+        n = slice_nodes if max_nodes is None else min(slice_nodes, max_nodes - state.nodes)
+        result = await loop.run_in_executor(executor, run, solver, state,
+            None if limit is None else limit - len(solutions), n, deadline, None, cancel)
+        # a process pool searches a copy of the state
+        state = result.state
+        solutions += result.solutions
+
+        if result.status != "nodes" or (max_nodes is not None and state.nodes >= max_nodes):
+            return SearchResult(solutions, state, result.status)
+
+class Checkpoint:
+    """Saves the search state to a file periodically.
+
+    The state is saved atmost once in every interval seconds. If saving takes
+    long, because the search stack is deep, the interval is increased so that
+    saving takes atmost max_overhead fraction of the time. The time is checked
+    once in every check_nodes nodes.
+
+    The puzzle text is saved along with the state, so that the search can be
+    resumed using only the checkpoint file. The output, if given, is flushed
+    before saving the state, so that the solutions written to it before a
+    checkpoint are not lost on a crash.
+
+    The solutions found after the last checkpoint are found again when the
+    search is resumed. When the output has an offset, like binary.Writer, the
+    offset after flushing is saved too, so the output can be truncated to it
+    before resuming and those solutions are not written twice.
+    """
+    def __init__(self, filename, puzzle, interval=60, max_overhead=0.05, check_nodes=1000, output=None):
+        self.filename = filename
+        self.puzzle = puzzle
+        self.interval = interval
+        self.max_overhead = max_overhead
+        self.check_nodes = check_nodes
+        self.output = output
+
+        self.next_nodes = 0
+        self.next_save = time.time() + interval
+
+    def update(self, state):
+        """Called by the search every check_nodes nodes."""
+        self.next_nodes = state.nodes + self.check_nodes
+        if time.time() >= self.next_save:
+            self.save(state)
+
+    def save(self, state):
+        offset = None
+        if self.output is not None:
+            self.output.flush()
+            offset = getattr(self.output, "offset", None)
+
+        import pickle
+        t0 = time.time()
+        tmp = self.filename + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(dict(version=1, puzzle=self.puzzle, state=state, offset=offset), f,
+                        pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.filename)
+
+        t1 = time.time()
+        self.next_save = t1 + max(self.interval, (t1 - t0) / self.max_overhead)
+
+def load_checkpoint(filename):
+    """Returns the puzzle text, the search state and the offset of the output,
+    or None when it has no offset, saved in a checkpoint file.
+
+    The checkpoint is a pickle file, so load only the files written by you.
+    """
+    import pickle
+    with open(filename, "rb") as f:
+        d = pickle.load(f)
+    return d["puzzle"], d["state"], d.get("offset")
+
+class IncrementalSolver:
+    """Base class for solvers that re-solve a puzzle after small edits.
+
+    The subclasses provide the edit methods, snapshot(), which returns a
+    hashable snapshot of the puzzle, and search(), which solves the current
+    puzzle and returns a SearchResult. An edit method changes the puzzle and
+    calls update.
+
+    The solutions of the recently seen snapshots are cached, so undoing an
+    edit doesn't search again.
+    """
+    def __init__(self, limit=100, cache_size=64):
+        self.limit = limit
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        self.solutions = None
+        self.complete = False
+
+    def solve(self):
+        if self.solutions is None:
+            self.update(False, None)
+        return self.solutions
+
+    def rebuild(self, solution):
+        """Returns the solution for the current puzzle, when a previous solution is still valid."""
+        return solution
+
+    def update(self, only_removes, accept):
+        """Updates the solutions after an edit.
+
+        only_removes tells that the edit can only remove solutions and accept
+        tells if a previous solution is still a solution. When the previous
+        solutions were complete, such an edit is handled by checking them
+        instead of searching again.
+        """
+        key = self.snapshot()
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            self.solutions, self.complete = self.cache[key]
+            return self.solutions
+
+        if only_removes and self.complete and self.solutions is not None:
+            self.solutions = [self.rebuild(s) for s in self.solutions if accept(s)]
+        else:
+            result = self.search()
+            self.solutions, self.complete = result.solutions, result.complete
+
+        self.cache[key] = self.solutions, self.complete
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return self.solutions
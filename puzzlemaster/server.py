@@ -0,0 +1,244 @@
+"""Long running puzzlemaster server.
+
+The server reads newline-delimited JSON requests from stdin or a unix socket
+and writes one JSON response line for each request. Requests are handled
+concurrently, so the responses may come in a different order than the
+requests. The "id" of the request is copied to the response.
+
+    {"id": 1, "op": "solve", "puzzle": "puzzle: twist\\n\\n12\\n21", "limit": 10, "timeout": 5}
+    {"id": 1, "ok": true, "result": {"count": 1, "complete": true, "solutions": ["..."]}}
+
+Supported ops:
+
+    parse   - parses the puzzle and returns its text in the normalized form,
+              see parser.normalize
+    render  - returns the svg of the puzzle, the compact svg if "compact" is true
+    solve   - returns upto "limit" solutions, expanding atmost "max_nodes" nodes,
+              using the solver "heuristics", like {"order": "fewest"}, and
+              restarting the search as in search.run_restarts with
+              "restarts" as the scale
+    check   - checks if the puzzle has exactly one solution
+    cancel  - cancels the request with id "target"
+
+The puzzle is given either as text in "puzzle" or as a path in "file".
+
+Solving and rendering are CPU bound and are done in a process pool. The worker processes
+live as long as the server, so the solver tables and the imported puzzle
+modules stay warm between requests. Each solve request has a deadline, after
+which the worker stops searching and returns the solutions found so far with
+"complete" set to false and "status" telling which budget was exhausted.
+
+A cancelled request is answered immediately. Each request running in the
+pool is given an event from a multiprocessing manager, which is set when the
+request is cancelled, so the worker stops searching within
+search.CANCEL_CHECK_NODES nodes and is free for the next request.
+"""
+import asyncio
+import collections
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import stat
+import sys
+import time
+
+from . import parser, search
+
+DEFAULT_TIMEOUT = 30
+DEFAULT_LIMIT = 100
+RENDER_CACHE_SIZE = 256
+
+def load_text(request):
+    if "puzzle" in request:
+        return request["puzzle"]
+    elif "file" in request:
+        with open(request["file"]) as f:
+            return f.read()
+    else:
+        raise ValueError("either puzzle or file must be specified")
+
+def load_puzzle(request):
+    return parser.parse(load_text(request))
+
+def render(request):
+    """Renders the puzzle in the request to svg. This runs in the worker processes."""
+    return load_puzzle(request).render(bool(request.get("compact"))).tostring()
+
+def solve(request, deadline, cancel=None):
+    """Solves the puzzle in the request. This runs in the worker processes."""
+    puzzle = load_puzzle(request)
+    result = search.solve(puzzle,
+        limit=request.get("limit", DEFAULT_LIMIT),
+        max_nodes=request.get("max_nodes"),
+        deadline=deadline,
+        heuristics=request.get("heuristics"),
+        restarts=request.get("restarts"),
+        cancel=cancel)
+
+    return dict(
+        count=len(result.solutions),
+        complete=result.complete,
+        status=result.status,
+        nodes=result.state.nodes,
+        solutions=[str(s) for s in result.solutions])
+
+def check(request, deadline, cancel=None):
+    """Checks that the puzzle in the request has exactly one solution."""
+    result = solve(dict(request, limit=2), deadline, cancel)
+    result["unique"] = result["count"] == 1 and result["complete"]
+    return result
+
+class ThreadReader:
+    """Reads the lines of a file in a thread, for the files that the event
+    loop can't read, like a regular file redirected to stdin.
+    """
+    def __init__(self, f):
+        self.f = f
+
+    async def readline(self):
+        return await asyncio.get_running_loop().run_in_executor(None, self.f.readline)
+
+class Server:
+    def __init__(self, jobs=None):
+        # The workers are spawned, not forked, so that they don't hold on to
+        # the client connections that are open when a worker is started.
+        self.context = multiprocessing.get_context("spawn")
+        self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=jobs, mp_context=self.context)
+        self.manager = None
+        self.tasks = {}
+        self.render_cache = collections.OrderedDict()
+
+    async def render(self, request):
+        """Renders the puzzle in the pool, remembering the recently rendered puzzles."""
+        key = request.get("puzzle") or request.get("file")
+        if "file" in request:
+            key = (key, os.path.getmtime(key))
+        compact = bool(request.get("compact"))
+        key = key, compact
+
+        if key in self.render_cache:
+            self.render_cache.move_to_end(key)
+        else:
+            loop = asyncio.get_running_loop()
+            self.render_cache[key] = await loop.run_in_executor(self.pool, render, request)
+            if len(self.render_cache) > RENDER_CACHE_SIZE:
+                self.render_cache.popitem(last=False)
+        return self.render_cache[key]
+
+    def cancel_event(self):
+        """Returns a new event that can be passed to the worker processes."""
+        # the manager is a process of its own, so it is started only when needed
+        if self.manager is None:
+            self.manager = self.context.Manager()
+        return self.manager.Event()
+
+    async def run_in_pool(self, func, request):
+        timeout = request.get("timeout", DEFAULT_TIMEOUT)
+        deadline = time.time() + timeout
+        loop = asyncio.get_running_loop()
+        cancel = self.cancel_event()
+        future = loop.run_in_executor(self.pool, func, request, deadline, cancel)
+        try:
+            # give the worker some extra time to return the partial results
+            return await asyncio.wait_for(future, timeout + 1)
+        except asyncio.CancelledError:
+            cancel.set()
+            raise
+
+    async def process(self, request):
+        op = request.get("op")
+        if op == "parse":
+            text = load_text(request)
+            # parsed to check that the puzzle is valid
+            parser.parse(text)
+            return parser.normalize(text)
+        elif op == "render":
+            return await self.render(request)
+        elif op == "solve":
+            return await self.run_in_pool(solve, request)
+        elif op == "check":
+            return await self.run_in_pool(check, request)
+        elif op == "cancel":
+            task = self.tasks.get(request.get("target"))
+            return task is not None and task.cancel()
+        else:
+            raise ValueError("unknown op: %r" % op)
+
+    async def handle(self, request, write):
+        id = request.get("id")
+        try:
+            result = await self.process(request)
+            response = dict(id=id, ok=True, result=result)
+        except asyncio.CancelledError:
+            response = dict(id=id, ok=False, error="cancelled")
+        except asyncio.TimeoutError:
+            response = dict(id=id, ok=False, error="timeout")
+        except Exception as e:
+            response = dict(id=id, ok=False, error="%s: %s" % (e.__class__.__name__, e))
+        finally:
+            if self.tasks.get(id) is asyncio.current_task():
+                del self.tasks[id]
+        write(json.dumps(response) + "\n")
+
+    async def serve_stream(self, reader, write):
+        """Reads requests from the reader till EOF and writes responses using write."""
+        pending = set()
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                write(json.dumps(dict(id=None, ok=False, error="invalid request: %s" % e)) + "\n")
+                continue
+
+            task = asyncio.ensure_future(self.handle(request, write))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+            if request.get("id") is not None and request.get("op") != "cancel":
+                self.tasks[request["id"]] = task
+
+        if pending:
+            await asyncio.wait(pending)
+
+    async def serve_stdio(self):
+        loop = asyncio.get_running_loop()
+        mode = os.fstat(sys.stdin.fileno()).st_mode
+        if stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode):
+            reader = asyncio.StreamReader(limit=2**24)
+            await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        else:
+            # regular files and terminals can't be read by the event loop
+            reader = ThreadReader(sys.stdin.buffer)
+
+        def write(line):
+            sys.stdout.write(line)
+            sys.stdout.flush()
+
+        await self.serve_stream(reader, write)
+
+    async def serve_unix(self, path):
+        async def client(reader, writer):
+            await self.serve_stream(reader, lambda line: writer.write(line.encode("utf-8")))
+            await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_unix_server(client, path, limit=2**24)
+        async with server:
+            await server.serve_forever()
+
+    def run(self, socket=None):
+        try:
+            if socket:
+                asyncio.run(self.serve_unix(socket))
+            else:
+                asyncio.run(self.serve_stdio())
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+            if self.manager is not None:
+                self.manager.shutdown()
@@ -1,8 +1,11 @@
 """Skyscrapers puzzle"""
+import math
 import random
 
 from .grid import Grid
 from . import utils
+from . import search
+from . import profiling
 from .parser import register_puzzle, parse_grid
 
 __all__ = ["SkyScrappers"]
@@ -67,17 +70,17 @@ class SkyScrappers:
 
     @staticmethod
     def load(filename):
-        data = [line.strip() for line in open(filename) if line.strip()]
-        return SkyScrappers(data)
+        return SkyScrappers.loads(open(filename).read())
 
     @staticmethod
     def loads(text):
         data = [line.strip() for line in text.splitlines() if line.strip()]
-        return SkyScrappers(data)
+        return SkyScrappersParser().parse(data)
 
-    def render(self):
-        """Returns svg object."""
-        grid = Grid(self.size, self.size)
+    @profiling.timed("draw")
+    def render(self, compact=False):
+        """Returns svg object. See Grid for the compact mode."""
+        grid = Grid(self.size, self.size, compact)
         grid.draw_grid(stroke='black', stroke_width=2)
 
         def text(row, col, value, **attrs):
@@ -105,22 +108,94 @@ class SkyScrappers:
 
         return grid.svg
 
+    def solver(self, **heuristics):
+        """Returns the Solver, see Solver for the heuristics."""
+        return Solver(self, **heuristics)
+
     def solve(self):
         return Solver(self).solve()
 
     def solve_all(self):
         return Solver(self).solve_all()
 
+    def incremental(self, limit=100):
+        """Returns an IncrementalSolver to edit and re-solve this puzzle."""
+        return IncrementalSolver(self, limit)
+
+    def pack(self):
+        """Returns the cells of a solved grid as bytes, two cells in each
+        byte, in the row major order.
+
+            >>> s = SkyScrappers.loads("*2**\\n*12*\\n*21*\\n****")
+            >>> s.pack()
+            b'\\x12!'
+            >>> str(s.unpack_solution(s.pack())) == str(s)
+            True
+        """
+        n = self.size
+        cells = [int(self.data[row, col]) for row in range(n) for col in range(n)]
+        if len(cells) % 2:
+            cells.append(0)
+        return bytes(a << 4 | b for a, b in zip(cells[::2], cells[1::2]))
+
+    def unpack_solution(self, data):
+        """Returns the solution of this puzzle packed as data by pack."""
+        n = self.size
+        cells = [str(d) for byte in data for d in (byte >> 4, byte & 15)]
+        values = dict(((row, col), cells[row*n + col]) for row in range(n) for col in range(n))
+        return SkyScrappers(n, values, self.constraints)
+
+    def tostring(self):
+        """Returns the grid with the clues on all four sides, as read by loads."""
+        n = self.size
+        def clue(side, i):
+            return self.constraints[side].get(i) or "*"
+
+        rows = ["*" + "".join(clue("top", i) for i in range(n)) + "*"]
+        for row in range(n):
+            cells = "".join(self.data.get((row, col)) or "*" for col in range(n))
+            rows.append(clue("left", row) + cells + clue("right", row))
+        rows.append("*" + "".join(clue("bottom", i) for i in range(n)) + "*")
+        return "\n".join(rows)
+
     def __str__(self):
-        d = self.data.copy()
-        for i in range(self.size):
-            d[i, self.size] = self.constraints['right'][i] or '*'
-            d[self.size, i] = self.constraints['bottom'][i] or '*'
-        d[self.size, self.size] = ""
+        return "puzzle: skyscrapers\n\n" + self.tostring()
+
+    def verify(self):
+        """Checks that the grid is filled with a latin square matching the
+        clues on all four sides.
 
-        return "\n".join(
-                    "".join(d[row, col] for col in range(self.size+1))
-                    for row in range(self.size+1))
+        Returns the list of problems found, which is empty for a valid solution.
+
+            >>> SkyScrappers.loads("*2**\\n*12*\\n*21*\\n****").verify()
+            []
+            >>> SkyScrappers.loads("*1**\\n*12*\\n*21*\\n****").verify()
+            ['top clue 0 is 1, but 2 buildings are visible']
+        """
+        size = self.size
+        digits = "123456789"[:size]
+        rows = cols = range(size)
+
+        empty = [s for s in cross(rows, cols) if not is_digit(self.data.get(s), size)]
+        if empty:
+            return ["%d cells are not filled" % len(empty)]
+
+        values = dict((s, str(self.data[s])) for s in cross(rows, cols))
+        problems = []
+        for i in range(size):
+            if "".join(sorted(line(values, size, "left", i))) != digits:
+                problems.append("row %d repeats a digit" % i)
+            if "".join(sorted(line(values, size, "top", i))) != digits:
+                problems.append("column %d repeats a digit" % i)
+
+        for side in SIDES:
+            for i in range(size):
+                clue = self.constraints[side][i]
+                if is_digit(clue, size):
+                    n = visible(line(values, size, side, i))
+                    if n != int(clue):
+                        problems.append("%s clue %d is %s, but %d buildings are visible" % (side, i, clue, n))
+        return problems
 
 def some(values):
     for v in values:
@@ -147,6 +222,26 @@ def visible(heights):
             n += 1
     return n
 
+SIDES = ["top", "right", "bottom", "left"]
+
+def line(values, size, side, i):
+    """Returns the heights in the i-th row or column in the order they are seen from the side.
+
+        >>> values = {(0, 0): 1, (0, 1): 2, (1, 0): 2, (1, 1): 1}
+        >>> line(values, 2, "right", 0)
+        [2, 1]
+        >>> line(values, 2, "top", 0)
+        [1, 2]
+    """
+    if side == "top":
+        return [values[row, i] for row in range(size)]
+    elif side == "bottom":
+        return [values[row, i] for row in range(size)][::-1]
+    elif side == "left":
+        return [values[i, col] for col in range(size)]
+    else:
+        return [values[i, col] for col in range(size)][::-1]
+
 def rotate(seq):
     """Right rotate a sequence.
         >>> rotate([1, 2, 3])
@@ -188,18 +283,118 @@ class Generator:
         for row in values:
             print(" ".join(str(d) for d in row))
 
+# The squares, units and peers depend only on the size of the puzzle.
+# They are computed once for each size and shared by all the solvers.
+_tables = {}
+
+def get_tables(size):
+    """Returns the squares, units and peers for a puzzle of the given size."""
+    if size not in _tables:
+        rows = cols = range(size)
+        squares = cross(rows, cols)
+        unitlists = [cross(rows, [c]) for c in cols] + [cross([r], cols) for r in rows]
+        units = dict((s, [u for u in unitlists if s in u]) for s in squares)
+        peers = dict((s, set(s2 for u in units[s] for s2 in u if s2 != s)) for s in squares)
+        _tables[size] = squares, units, peers
+    return _tables[size]
+
+def stirling(n, k):
+    """Returns the number of permutations of n with k left to right maxima,
+    which is the number of rows of size n with k buildings visible from the
+    left. These are the unsigned Stirling numbers of the first kind.
+
+        >>> [stirling(4, k) for k in range(1, 5)]
+        [6, 11, 6, 1]
+    """
+    row = [1]
+    for i in range(n):
+        row = [(row[j-1] if j else 0) + (i * row[j] if j < len(row) else 0) for j in range(len(row)+1)]
+    return row[k] if 0 <= k < len(row) else 0
+
+class Domains(dict):
+    """Candidates of the squares, which also keeps the unfilled squares in
+    buckets by the number of candidates, so that the square with the fewest
+    candidates is found without scanning all the squares.
+    """
+    def __init__(self, values, squares):
+        dict.__init__(self, values)
+        self.squares = squares
+        self.buckets = [set() for i in range(max(len(values[s]) for s in squares) + 1)]
+        for s in squares:
+            if len(values[s]) > 1:
+                self.buckets[len(values[s])].add(s)
+
+    def __setitem__(self, s, v):
+        old = dict.get(self, s, "")
+        if len(old) > 1:
+            self.buckets[len(old)].discard(s)
+        if len(v) > 1:
+            self.buckets[len(v)].add(s)
+        dict.__setitem__(self, s, v)
+
+    def copy(self):
+        d = Domains.__new__(Domains)
+        dict.update(d, self)
+        d.squares = self.squares
+        d.buckets = [set(b) for b in self.buckets]
+        return d
+
+    def __reduce__(self):
+        return Domains, (dict(self), self.squares)
+
+    def fewest(self):
+        """Returns the unfilled squares with the fewest candidates."""
+        for b in self.buckets[2:]:
+            if b:
+                return b
+        return ()
+
+    def unfilled(self):
+        return iterjoin(self.buckets[2:])
+
 class Solver:
     """Skyscraper solver inspired by Norvig's Sudoku solver.
 
     http://norvig.com/sudoku.html
+
+    The square to branch on is chosen using one of the orders:
+
+        mrv     - the square with the fewest candidates
+        domwdeg - the square with the smallest ratio of the number of
+                  candidates to the weight of its row and column, where the
+                  weight of a row or column is the number of times the search
+                  failed in it. This learns the hard parts of the puzzle.
+        clues   - the square with the fewest candidates, breaking the ties
+                  by the tightest clues on its row and column, the clues
+                  satisfied by the fewest permutations.
+
+    The digits are tried in the value_order "order", which is the increasing
+    order, or "lcv", which tries first the digits that remove the fewest
+    candidates from the peers. When a seed is given, the ties are broken at
+    random and the digits in the increasing order are shuffled, to make
+    restarts (see search.run_restarts) try a different part of the tree.
+    The domwdeg weights learned by a run are passed on to the next one as
+    weights, see learned.
+
+        >>> puzzle = SkyScrappers.loads("******\\n*****1\\n*****2\\n*****2\\n*****2\\n*1222*")
+        >>> [len(search.run(Solver(puzzle, order, value_order)).solutions)
+        ...  for order in ORDERS for value_order in VALUE_ORDERS]
+        [1, 1, 1, 1, 1, 1]
     """
-    def __init__(self, puzzle):
+    def __init__(self, puzzle, order="mrv", value_order="order", seed=None, weights=None):
+        if order not in ORDERS:
+            raise ValueError("unknown order %r, expected one of %s" % (order, ", ".join(ORDERS)))
+        if value_order not in VALUE_ORDERS:
+            raise ValueError("unknown value order %r, expected one of %s" % (value_order, ", ".join(VALUE_ORDERS)))
+
         self.size = puzzle.size
         self.constraints = puzzle.constraints
+        self.order = order
+        self.value_order = value_order
+        self.random = seed is not None and random.Random(seed)
 
         size = self.size
-        rows = cols = range(size)
-        squares = cross(rows, cols)
+        squares, units, peers = get_tables(size)
 
         digits = "".join(str(i) for i in range(1, size+1)) # assuming that the size will never be more than 9
 
@@ -208,26 +403,29 @@ class Solver:
             if values[k] == '*':
                 values[k] = digits
 
-        unitlists = [cross(rows, [c]) for c in cols] + [cross([r], cols) for r in rows]
-        units = dict((s, [u for u in unitlists if s in u]) for s in squares)
-        peers = dict((s, set(s2 for u in units[s] for s2 in u if s2 != s)) for s in squares)
-
         self.squares = squares
         self.digits = digits
         self.values = values
         self.units = units
         self.peers = peers
 
+        # failure counts of the rows and the columns, for domwdeg
+        self.weights = None
+        if order == "domwdeg":
+            self.weights = weights or dict((line, 1) for i in range(size) for line in [("row", i), ("col", i)])
+        if order == "clues":
+            self.tightness = self.clue_tightness()
+
     def solve(self):
         it = self.solve_all()
 
         try:
-            return it.next()
+            return next(it)
         except StopIteration:
             return None
 
     def solve_all(self):
-        return (SkyScrappers(self.size, values, self.constraints) for values in self.search(self.values))
+        return (self.make_solution(values) for values in self.search(self.values))
 
     def validate(self, values):
         """
@@ -236,24 +434,16 @@ class Solver:
             >>> solver.validate(puzzle.data)
             True
         """
-        def validate_right(row):
-            n = self.constraints['right'][row]
+        def validate_side(side, i):
+            n = self.constraints[side][i]
             # no constraint
             if str(n) not in self.digits:
                 return True
-            heights = [values[row, col] for col in range(self.size)][::-1]
-            return visible(heights) == int(n)
+            return visible(line(values, self.size, side, i)) == int(n)
 
-        def validate_bottom(col):
-            n = self.constraints['bottom'][col]
-            # no constraint
-            if str(n) not in self.digits:
-                return True
-            heights = [values[row, col] for row in range(self.size)][::-1]
-            return visible(heights) == int(n)
-
-        return all(validate_right(row) for row in range(self.size)) \
-               and all(validate_bottom(col) for col in range(self.size))
+        return all(validate_side(side, i)
+                   for side in SIDES if side in self.constraints
+                   for i in range(self.size))
 
     def debug(self, values, indent=""):
         sep = "\n" + indent
@@ -267,24 +457,133 @@ class Solver:
         print(indent + "right", f(self.constraints['right']))
         print(indent + "bottom", f(self.constraints['bottom']))
 
+    def clue_tightness(self):
+        """Returns the tightness of the clues on the row and the column of
+        every square, which is -log of the fraction of the permutations
+        satisfying them.
+        """
+        n = self.size
+        factorial = math.factorial(n)
+        def tightness(clue):
+            if not is_digit(clue, n):
+                return 0.0
+            return -math.log(stirling(n, int(clue)) / factorial)
+
+        def clue(side, i):
+            clues = self.constraints.get(side) or {}
+            return clues[i] if isinstance(clues, list) or i in clues else None
+
+        rows = [tightness(clue("left", i)) + tightness(clue("right", i)) for i in range(n)]
+        cols = [tightness(clue("top", i)) + tightness(clue("bottom", i)) for i in range(n)]
+        return dict(((r, c), rows[r] + cols[c]) for r, c in self.squares)
+
+    def lines(self, s):
+        return ("row", s[0]), ("col", s[1])
+
+    def unit_line(self, u):
+        r, c = u[0]
+        return ("row", r) if all(s[0] == r for s in u) else ("col", c)
+
+    def learned(self):
+        """Returns the heuristics learned by the search, which are passed to
+        the solver of the next restart.
+        """
+        return dict(weights=self.weights) if self.weights is not None else {}
+
+    def fail(self, lines):
+        """Records a failure of the search in the lines, for domwdeg."""
+        for line in lines:
+            self.weights[line] += 1
+
+    def choose(self, values):
+        """Returns the unfilled square to branch on."""
+        tie = self.random.random if self.random else lambda: 0
+        if self.order == "mrv":
+            return min(values.fewest(), key=lambda s: (tie(), s))
+        elif self.order == "clues":
+            return min(values.fewest(), key=lambda s: (-self.tightness[s], tie(), s))
+        else:
+            weights = self.weights
+            return min(values.unfilled(), key=lambda s: (len(values[s]) / (weights["row", s[0]] + weights["col", s[1]]), tie(), s))
+
+    def order_values(self, values, s):
+        """Returns the candidates of the square in the order they are tried."""
+        digits = list(values[s])
+        if self.random:
+            self.random.shuffle(digits)
+        if self.value_order == "lcv":
+            peers = self.peers[s]
+            digits.sort(key=lambda d: sum(d in values[p] for p in peers))
+        return digits
+
+    def failed_lines(self, values):
+        """Returns the rows and the columns whose clues are not satisfied."""
+        failed = []
+        for side in SIDES:
+            for i in range(self.size):
+                n = self.constraints.get(side) and self.constraints[side][i]
+                if is_digit(n, self.size) and visible(line(values, self.size, side, i)) != int(n):
+                    failed.append(("row", i) if side in ("left", "right") else ("col", i))
+        return failed
+
     def search(self, values):
-        if values is False or values == []:
-            return [] # Failed earlier
+        """Generates all the solutions reachable from values.
 
-        if all(len(values[s]) == 1 for s in self.squares):
-            if self.validate(values) is False:
-                return []
-            else:
-                return [values]
+        This recursive search is faster than search.iterate, which is used
+        when the search has a budget or is to be resumed.
+        """
+        return self._search(Domains(values, self.squares))
+
+    def _search(self, values):
+        if values is False:
+            return # Failed earlier
 
-        # Choose the unfilled square s with the fewest possibilities
-        _, s = min((len(values[s]), s) for s in self.squares if len(values[s]) > 1)
+        if not values.fewest():
+            if self.check(values):
+                yield values
+            return
 
-        return iterjoin(self.search(self.assign(values.copy(), s, d))
-                    for d in values[s])
+        s = self.choose(values)
+        for d in self.order_values(values, s):
+            yield from self._search(self.assign(values.copy(), s, d))
+
+    def check(self, values):
+        """Returns True if the filled values are a solution, recording the
+        failed lines for domwdeg when they are not.
+        """
+        if self.validate(values) is False:
+            if self.weights is not None:
+                self.fail(self.failed_lines(values))
+            return False
+        return True
+
+    def root(self):
+        return [(self.values, None, None)]
+
+    def expand(self, move):
+        """Assigns digit d to the square s and returns (solution, moves) for the resulting values.
+
+        The move at the root has no square and starts the search from the given values.
+        """
+        values, s, d = move
+        if s is None:
+            values = Domains(values, self.squares)
+        else:
+            values = self.assign(values.copy(), s, d)
+
+        if values is False:
+            return None, None # Failed earlier
+
+        if not values.fewest():
+            return (values if self.check(values) else None), None
+
+        s = self.choose(values)
+        return None, [(values, s, d) for d in self.order_values(values, s)]
 
     def make_puzzle(self, values):
-        return SkyScrappers(self.size, values, self.constraints)
+        return SkyScrappers(self.size, dict(values), self.constraints)
+
+    make_solution = make_puzzle
 
     def assign(self, values, s, d, level=0):
         if values[s] == d:
@@ -300,6 +599,8 @@ class Solver:
         values[s] = values[s].replace(d, '')
 
         if len(values[s]) == 0: #contradiction
+            if self.weights is not None:
+                self.fail(self.lines(s))
             return False
 
         if len(values[s]) == 1:
@@ -312,6 +613,8 @@ class Solver:
         for u in self.units[s]:
             dplaces = [s for s in u if d in values[s]]
             if len(dplaces) == 0:
+                if self.weights is not None:
+                    self.fail([self.unit_line(u)])
                 return False
             elif len(dplaces) == 1 and values[dplaces[0]] != d:
                 # d can only be in one place in unit; assign it there if it is not already assigned
@@ -335,6 +638,98 @@ class Solver:
         hline()
         print(" " + "".join(str(c).center(width) for c in self.constraints['bottom']))
 
+ORDERS = ["mrv", "domwdeg", "clues"]
+VALUE_ORDERS = ["order", "lcv"]
+
+def is_digit(value, size):
+    return value is not None and len(str(value)) == 1 and str(value) in "123456789"[:size]
+
+class IncrementalSolver(search.IncrementalSolver):
+    """Re-solves a skyscrapers puzzle after a clue or a cell is edited.
+
+    The candidates after propagating the given cells are kept between the
+    edits, so editing a clue doesn't redo the propagation and setting a cell
+    only propagates that cell. Setting an empty cell or a missing clue can
+    only remove solutions, so when all the solutions are known, they are just
+    checked against the new cell or clue.
+
+        >>> puzzle = SkyScrappers.loads("******\\n*****1\\n*****2\\n*****2\\n*****2\\n*1222*")
+        >>> editor = puzzle.incremental()
+        >>> len(editor.set_clue("right", 1, None))
+        2
+        >>> len(editor.set_cell(0, 1, "3"))
+        1
+        >>> len(editor.set_cell(0, 0, "2"))
+        0
+        >>> len(editor.set_clue("top", 0, None))
+        0
+    """
+    def __init__(self, puzzle, limit=100):
+        search.IncrementalSolver.__init__(self, limit)
+        self.size = puzzle.size
+        self.data = dict(puzzle.data)
+        self.constraints = dict((side, dict(enumerate(clues)) if isinstance(clues, list) else dict(clues))
+                                for side, clues in puzzle.constraints.items())
+        self.solver = Solver(puzzle)
+        self.values = self.propagate()
+
+    def puzzle(self):
+        constraints = dict((side, dict(clues)) for side, clues in self.constraints.items())
+        return SkyScrappers(self.size, dict(self.data), constraints)
+
+    def snapshot(self):
+        return (tuple(sorted(self.data.items())),
+                tuple((side, tuple(sorted(clues.items()))) for side, clues in sorted(self.constraints.items())))
+
+    def propagate(self):
+        """Returns the candidates of every square after assigning the given cells."""
+        values = dict((s, self.solver.digits) for s in self.solver.squares)
+        for s in self.solver.squares:
+            d = self.data.get(s)
+            if is_digit(d, self.size):
+                values = self.solver.assign(values, s, d)
+                if values is False:
+                    break
+        return values
+
+    def search(self):
+        if self.values is False:
+            return search.SearchResult([], search.SearchState([]), "complete")
+        solver = Solver(self.puzzle())
+        solver.values = self.values
+        return search.run(solver, limit=self.limit)
+
+    def rebuild(self, solution):
+        return SkyScrappers(self.size, solution.data, self.puzzle().constraints)
+
+    def set_cell(self, row, col, value):
+        """Sets the cell to the digit value, or clears it when value is None or "*"."""
+        value = str(value) if is_digit(value, self.size) else "*"
+        old = self.data.get((row, col), "*")
+        if value == old:
+            return self.solve()
+
+        self.data[row, col] = value
+        if old == "*" and self.values is not False:
+            self.values = self.solver.assign(self.values.copy(), (row, col), value)
+        else:
+            self.values = self.propagate()
+        return self.update(old == "*", lambda s: s.data[row, col] == value)
+
+    def set_clue(self, side, i, value):
+        """Sets the i-th clue on the side to value, or clears it when value is None or "*"."""
+        value = str(value) if is_digit(value, self.size) else "*"
+        old = self.constraints[side].get(i)
+        # the parser keeps the missing clues as None
+        old = str(old) if is_digit(old, self.size) else "*"
+        if value == old:
+            return self.solve()
+
+        self.constraints[side][i] = value
+        if value == "*":
+            return self.update(False, None)
+        accept = lambda s: visible(line(s.data, self.size, side, i)) == int(value)
+        return self.update(old == "*", accept)
 
 register_puzzle("skyscrapers", SkyScrappers)
 
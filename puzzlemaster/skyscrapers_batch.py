@@ -0,0 +1,210 @@
+"""Batch solver for small skyscrapers puzzles using NumPy.
+
+For the sizes upto MAX_TABLE_SIZE, all the latin squares are computed once
+along with the clues seen from all four sides. A batch of puzzles is solved
+by comparing the clues and the given cells of every puzzle with that table,
+a chunk of puzzles at a time.
+
+There are 812,851,200 latin squares of size 6, which is too many to keep in
+memory. For the sizes upto MAX_ROWS_SIZE, the rows are picked from the
+permutations matching the left, right and given cells of each row, using bit
+masks to find the permutations that don't repeat a digit in any column.
+
+Larger puzzles are solved using skyscrapers.Solver.
+
+    >>> from puzzlemaster import parser
+    >>> puzzle = parser.parse("puzzle: skyscrapers\\n\\n******\\n*****1\\n*****2\\n*****2\\n*****2\\n*1222*")
+    >>> [s.tostring() for s in solve_batch([puzzle])[0]]
+    ['******\\n*12341\\n*23412\\n*34122\\n*41232\\n*1222*']
+"""
+import itertools
+
+import numpy as np
+
+from . import search, profiling
+from . import skyscrapers
+from .skyscrapers import SkyScrappers
+
+__all__ = ["solve_batch"]
+
+MAX_TABLE_SIZE = 5
+MAX_ROWS_SIZE = 6
+
+# maximum size of the boolean array compared at once
+CHUNK_SIZE = 2**26
+
+SIDES = skyscrapers.SIDES
+
+def permutations(n):
+    return np.array(list(itertools.permutations(range(1, n+1))), dtype=np.int8)
+
+def visible(a, axis):
+    """Returns the number of buildings visible looking along the axis, for every line of a.
+
+        >>> visible(np.array([[1, 3, 2, 4], [4, 3, 2, 1]]), axis=1)
+        array([3, 1])
+    """
+    tallest = np.maximum.accumulate(a, axis=axis)
+    return 1 + np.count_nonzero(np.diff(tallest, axis=axis), axis=axis)
+
+def clues(squares):
+    """Returns the clues of all four sides of the squares, as an array of shape (N, 4, n)."""
+    return np.stack([
+        visible(squares, 1),
+        visible(squares[:, :, ::-1], 2),
+        visible(squares[:, ::-1, :], 1),
+        visible(squares, 2),
+    ], axis=1).astype(np.int8)
+
+def latin_squares(n):
+    """Returns all the latin squares of size n as an array of shape (N, n, n)."""
+    perms = permutations(n)
+    # compatible[i, j] is True when the permutations i and j can be rows of the same square
+    compatible = ~(perms[:, None, :] == perms[None, :, :]).any(axis=2)
+
+    rows = np.arange(len(perms))[:, None]
+    for k in range(1, n):
+        ok = compatible[rows[:, 0]]
+        for j in range(1, k):
+            ok &= compatible[rows[:, j]]
+        squares, perm = np.nonzero(ok)
+        rows = np.column_stack([rows[squares], perm])
+    return perms[rows]
+
+# latin squares and their features, computed once for each size
+_tables = {}
+
+def get_table(n):
+    """Returns the latin squares of size n and their features.
+
+    The features of a square are its clues on the four sides followed by its
+    cells, in the same layout as puzzle_vector.
+    """
+    if n not in _tables:
+        squares = latin_squares(n)
+        features = np.concatenate([clues(squares).reshape(len(squares), -1), squares.reshape(len(squares), -1)], axis=1)
+        _tables[n] = squares, features
+    return _tables[n]
+
+# permutations of size n with their left and right clues and column bit masks
+_rows = {}
+
+def get_rows(n):
+    if n not in _rows:
+        perms = permutations(n)
+        left = visible(perms, 1)
+        right = visible(perms[:, ::-1], 1)
+        # bit c*n+v-1 is set when the permutation has the digit v in column c
+        bits = (np.int64(1) << (np.arange(n) * n + perms - 1).astype(np.int64)).sum(axis=1)
+        _rows[n] = perms, left, right, bits
+    return _rows[n]
+
+def digit(value, n):
+    if value and value.isdigit() and 1 <= int(value) <= n:
+        return int(value)
+    return 0
+
+def puzzle_vector(puzzle):
+    """Returns the clues of the four sides followed by the given cells of the
+    puzzle as an array. Missing clues and empty cells are 0.
+    """
+    n = puzzle.size
+    q = np.zeros(4*n + n*n, dtype=np.int8)
+    for s, side in enumerate(SIDES):
+        for i in range(n):
+            q[s*n + i] = digit(puzzle.constraints[side].get(i), n)
+    for (row, col), value in puzzle.data.items():
+        # the parser leaves the corners of the clue border in the data
+        if 0 <= row < n and 0 <= col < n:
+            q[4*n + row*n + col] = digit(value, n)
+    return q
+
+def make_solution(puzzle, square):
+    n = puzzle.size
+    data = dict(((row, col), str(square[row, col])) for row in range(n) for col in range(n))
+    return SkyScrappers(n, data, puzzle.constraints)
+
+def solve_table(puzzles, limit=None):
+    n = puzzles[0].size
+    squares, features = get_table(n)
+    queries = np.array([puzzle_vector(p) for p in puzzles])
+
+    results = []
+    chunk = max(1, CHUNK_SIZE // features.size)
+    for i in range(0, len(puzzles), chunk):
+        q = queries[i:i+chunk]
+        # compare only the features that are given in atleast one puzzle of the chunk
+        columns = np.flatnonzero(q.any(axis=0))
+        q = q[:, None, columns]
+        f = features[None, :, columns]
+        matches = ((q == 0) | (q == f)).all(axis=2)
+
+        for puzzle, m in zip(puzzles[i:i+chunk], matches):
+            index = np.flatnonzero(m)[:limit]
+            results.append([make_solution(puzzle, squares[j]) for j in index])
+    return results
+
+def solve_rows(puzzle, limit=None):
+    n = puzzle.size
+    perms, left, right, bits = get_rows(n)
+    q = puzzle_vector(puzzle)
+    top, right_clues, bottom, left_clues = q[:4*n].reshape(4, n)
+    cells = q[4*n:].reshape(n, n)
+
+    candidates = []
+    for r in range(n):
+        ok = ((cells[r] == 0) | (perms == cells[r])).all(axis=1)
+        if left_clues[r]:
+            ok &= left == left_clues[r]
+        if right_clues[r]:
+            ok &= right == right_clues[r]
+        candidates.append(np.flatnonzero(ok))
+
+    solutions = []
+
+    def extend(rows, used, tallest, seen):
+        if len(rows) == n:
+            square = perms[rows]
+            from_bottom = visible(square[::-1], 0)
+            if ((bottom == 0) | (from_bottom == bottom)).all() and ((top == 0) | (seen == top)).all():
+                solutions.append(make_solution(puzzle, square))
+            return
+
+        c = candidates[len(rows)]
+        c = c[(bits[c] & used) == 0]
+        # number of buildings seen from the top can only grow, prune the rows that make it exceed the clue
+        seen_c = seen + (perms[c] > tallest)
+        c = c[((top == 0) | (seen_c <= top)).all(axis=1)]
+
+        for i in c:
+            if limit is not None and len(solutions) >= limit:
+                return
+            extend(rows + [i], used | bits[i], np.maximum(tallest, perms[i]), seen + (perms[i] > tallest))
+
+    extend([], np.int64(0), np.zeros(n, dtype=np.int8), np.zeros(n, dtype=np.int64))
+    return solutions
+
+@profiling.timed("solve")
+def solve_batch(puzzles, limit=None):
+    """Solves a batch of skyscrapers puzzles.
+
+    Returns a list with the solutions of each puzzle, atmost limit solutions
+    for each puzzle when limit is given.
+    """
+    groups = {}
+    for i, p in enumerate(puzzles):
+        groups.setdefault(p.size, []).append(i)
+
+    results = [None] * len(puzzles)
+    for n, index in groups.items():
+        group = [puzzles[i] for i in index]
+        if n <= MAX_TABLE_SIZE:
+            solutions = solve_table(group, limit)
+        elif n <= MAX_ROWS_SIZE:
+            solutions = [solve_rows(p, limit) for p in group]
+        else:
+            solutions = [search.solve(p, limit=limit).solutions for p in group]
+
+        for i, s in zip(index, solutions):
+            results[i] = s
+    return results
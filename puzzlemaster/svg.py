@@ -4,6 +4,10 @@ from __future__ import with_statement
 from xml.etree import ElementTree
 from io import StringIO
 
+from . import profiling
+
+XLINK = "http://www.w3.org/1999/xlink"
+
 class Node:
     """SVG Node"""
     def __init__(self, tag, **attrs):
@@ -29,6 +33,14 @@ class Node:
     def __getattr__(self, tag):
         return lambda **attrs: self.node(tag, **attrs)
 
+    def use(self, id, **attrs):
+        """Adds a <use> of the element with the given id.
+
+        The reference is given as xlink:href, as the plain href of SVG 2 is
+        not supported by older renderers like librsvg, Batik and ImageMagick.
+        """
+        return self.node("use", **dict({"xlink:href": "#" + id}, **attrs))
+
     def translate(self, x, y):
         return self.g(transform="translate(%s, %s)" % (x, y))
 
@@ -72,12 +84,16 @@ class Node:
         f.write(self.tostring())
         f.close()
 
+    @profiling.timed("tostring")
     def tostring(self, encoding='utf-8'):
-        builder = ElementTree.TreeBuilder()
-        self.build_tree(builder)
-        e = builder.close()
-        self._indent(e)
-        return ElementTree.tostring(e, encoding).decode(encoding)
+        with profiling.stage("build_tree"):
+            builder = ElementTree.TreeBuilder()
+            self.build_tree(builder)
+            e = builder.close()
+        with profiling.stage("indent"):
+            self._indent(e)
+        with profiling.stage("serialize"):
+            return ElementTree.tostring(e, encoding).decode(encoding)
 
 class Text(Node):
     """Text Node
@@ -118,6 +134,101 @@ class SVG(Node):
         attrs['xmlns'] = "http://www.w3.org/2000/svg"
         Node.__init__(self, 'svg', **attrs)
 
+    def add_defs(self):
+        """Adds a Defs as the first child and returns it."""
+        # the elements in the defs are referred to using xlink:href
+        self.attrs["xmlns:xlink"] = XLINK
+        defs = Defs()
+        self.children.insert(0, defs)
+        return defs
+
+# CSS properties that take a length, which needs a unit in CSS
+LENGTH_PROPERTIES = ["font-size", "stroke-width"]
+
+def css_declarations(attrs):
+    """Returns the presentation attributes as CSS declarations.
+
+        >>> css_declarations([("font-size", "48"), ("style", "dominant-baseline: central;")])
+        'font-size:48px;dominant-baseline: central'
+    """
+    declarations = []
+    for name, value in attrs:
+        if name == "style":
+            declarations.append(value.strip().rstrip(";"))
+        elif name in LENGTH_PROPERTIES and value.replace(".", "", 1).isdigit():
+            declarations.append("%s:%spx" % (name, value))
+        else:
+            declarations.append("%s:%s" % (name, value))
+    return ";".join(declarations)
+
+# attributes that are not presentation attributes, which stay on the elements
+GEOMETRY = ["x", "y", "x1", "y1", "x2", "y2", "cx", "cy", "r", "rx", "ry", "width", "height", "transform", "points", "d"]
+
+class Style(Node):
+    """Style element with the CSS classes of a Defs."""
+    def __init__(self, classes):
+        Node.__init__(self, "style")
+        self.classes = classes
+
+    def build_tree(self, builder):
+        builder.start(self.tag, self.attrs)
+        builder.data("".join(".%s{%s}" % (name, css_declarations(attrs)) for attrs, name in self.classes.items()))
+        return builder.end(self.tag)
+
+class Defs(Node):
+    """Definitions shared by the elements of an svg.
+
+    The presentation attributes repeated by many elements are declared once
+    as a CSS class and the elements repeated at many places are declared
+    once and placed using <use>.
+
+        >>> svg = SVG(width=200, height=100)
+        >>> defs = svg.add_defs()
+        >>> for x in [50, 150]:
+        ...     svg.use(defs.symbol("circle", r=3, fill="red"), x=x, y=50)
+        <use .../>
+        <use .../>
+        >>> print(svg.tostring())
+        <svg width="200" height="100" xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink">
+          <defs>
+            <style>.c0{fill:red}</style>
+            <circle id="d0" r="3" class="c0" />
+          </defs>
+          <use xlink:href="#d0" x="50" y="50" />
+          <use xlink:href="#d0" x="150" y="50" />
+        </svg>
+        <BLANKLINE>
+    """
+    def __init__(self):
+        Node.__init__(self, "defs")
+        self.classes = {}
+        self.symbols = {}
+        self.add_node(Style(self.classes))
+
+    def css_class(self, **attrs):
+        """Returns the name of the CSS class with the given presentation attributes."""
+        key = tuple((k.replace('_', '-'), str(v)) for k, v in sorted(attrs.items()))
+        if key not in self.classes:
+            self.classes[key] = "c%d" % len(self.classes)
+        return self.classes[key]
+
+    def symbol(self, tag, text=None, **attrs):
+        """Returns the id of an element declared in the defs, declaring it
+        if needed. The attributes other than the geometry are moved to a
+        CSS class.
+        """
+        key = tag, text, tuple(sorted((k, str(v)) for k, v in attrs.items()))
+        if key not in self.symbols:
+            geometry = dict((k, v) for k, v in attrs.items() if k in GEOMETRY)
+            style = dict((k, v) for k, v in attrs.items() if k not in GEOMETRY)
+            if style:
+                geometry["class"] = self.css_class(**style)
+            id = self.symbols[key] = "d%d" % len(self.symbols)
+            node = self.node(tag, id=id, **geometry)
+            if text is not None:
+                node(text)
+        return self.symbols[key]
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod()
\ No newline at end of file
@@ -1,10 +1,12 @@
 """Twist Puzzle.
 """
 
-import re
-from . import parser, utils
+import collections
+import sys
+import random
+
+from . import parser, utils, search, profiling
 from .grid import Grid
-import pprint
 
 class TwistParser:
     """Twist puzzle parser.
@@ -49,8 +51,8 @@ class TwistSolutionParser:
         for (y, x), v in sorted(data.items()):
             if v in markers:
                 dx1, dy1, dx2, dy2 = markers[v]
-                x1, y1 = (x+dx1)/2, (y+dy1)/2
-                x2, y2 = (x+dx2)/2, (y+dy2)/2
+                x1, y1 = (x+dx1)//2, (y+dy1)//2
+                x2, y2 = (x+dx2)//2, (y+dy2)//2
                 c = (y1, x1), (y2, x2)
                 connections.append(c)
 
@@ -66,12 +68,13 @@ class Twist:
     def loads(text):
         return TwistParser().parse(text.splitlines())
 
-    def render(self):
-        grid = self.render_grid()
+    @profiling.timed("draw")
+    def render(self, compact=False):
+        grid = self.render_grid(compact)
         return grid.svg
 
-    def render_grid(self):
-        grid = Grid(self.cols, self.rows)
+    def render_grid(self, compact=False):
+        grid = Grid(self.cols, self.rows, compact)
 
         grid.rect(0, 0, 1, 1, fill="#ddd")
         grid.rect(self.cols-1, self.rows-1, 1, 1, fill="#ddd")
@@ -80,15 +83,45 @@ class Twist:
         grid.draw_numbers(self.data)
         return grid
 
+    def solver(self, **heuristics):
+        """Returns the TwistSolver, see TwistSolver for the heuristics."""
+        return TwistSolver(self.data, **heuristics)
+
     def solve(self):
         return TwistSolver(self.data).solve()
 
+    def incremental(self, limit=100):
+        """Returns an IncrementalTwistSolver to edit and re-solve this puzzle."""
+        return IncrementalTwistSolver(self, limit)
+
+    def solve_all(self):
+        return self.solve()
+
+    def counter(self, max_entries=2**20):
+        """Returns a TwistCounter to count and sample the solutions."""
+        return TwistCounter(TwistSolver(self.data), max_entries)
+
     def tostring(self):
         return utils.matrix2str(utils.dict2matrix(self.data))
 
     def __str__(self):
         return "puzzle: twist\n\n" + self.tostring()
 
+    def unpack_solution(self, data):
+        """Returns the TwistSolution packed as data by TwistSolution.pack."""
+        node = 0, 0
+        connections = []
+        for d in data:
+            dy, dx = DIRECTIONS[d]
+            next = node[0] + dy, node[1] + dx
+            connections.append((node, next))
+            node = next
+        return TwistSolution(self, connections)
+
+# the moves to the neighbours, indexed by the direction bytes of the packed solutions
+DIRECTIONS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+DIRECTION_INDEX = dict((d, i) for i, d in enumerate(DIRECTIONS))
+
 class TwistSolution:
     def __init__(self, twist, connections):
         self.puzzle = twist
@@ -98,8 +131,9 @@ class TwistSolution:
     def loads(text):
         return TwistSolutionParser().parse(text.splitlines())
 
-    def render(self):
-        grid = self.puzzle.render_grid()
+    @profiling.timed("draw")
+    def render(self, compact=False):
+        grid = self.puzzle.render_grid(compact)
         for (y1, x1), (y2, x2) in self.connections:
             # we want to draw from the centers
             x1, y1, x2, y2 = x1+0.5, y1+0.5, x2+0.5, y2+0.5
@@ -135,6 +169,98 @@ class TwistSolution:
     def __str__(self):
         return "puzzle: twist-solution\n\n" + self.tostring()
 
+    def path(self):
+        """Returns the cells in the order of the path, starting at the top left cell."""
+        connections = self.connections
+        if connections and connections[0][0] == (0, 0) and all(a[1] == b[0] for a, b in zip(connections, connections[1:])):
+            return [connections[0][0]] + [b for a, b in connections]
+
+        # the connections of a parsed solution are not in the order of the path
+        neighbours = collections.defaultdict(list)
+        for a, b in connections:
+            neighbours[a].append(b)
+            neighbours[b].append(a)
+        path = [(0, 0)]
+        previous = None
+        while len(path) <= len(connections):
+            next = [n for n in neighbours[path[-1]] if n != previous]
+            if not next:
+                break
+            previous = path[-1]
+            path.append(next[0])
+        return path
+
+    def pack(self):
+        """Returns the path as bytes, one byte for the direction of each move.
+
+            >>> s = TwistSolution.loads("1-2\\n /\\n1-2")
+            >>> s.pack()
+            b'\\x04\\x05\\x04'
+            >>> s.puzzle.unpack_solution(s.pack()).connections
+            [((0, 0), (0, 1)), ((0, 1), (1, 0)), ((1, 0), (1, 1))]
+        """
+        path = self.path()
+        return bytes(DIRECTION_INDEX[b[0] - a[0], b[1] - a[1]] for a, b in zip(path, path[1:]))
+
+    def verify(self):
+        """Checks that the connections make a valid path in a single pass over the path.
+
+        Returns the list of problems found, which is empty for a valid solution.
+
+            >>> TwistSolution.loads("1-2\\n /\\n1-2").verify()
+            []
+            >>> TwistSolution.loads("1-2\\n  |\\n1-2").verify()
+            ['2 is followed by 2 at (1, 1)']
+        """
+        data = self.puzzle.data
+        begin = (0, 0)
+        end = (self.puzzle.rows-1, self.puzzle.cols-1)
+        values = sorted(set(data.values()))
+        next_value = dict(zip(values, values[1:] + values[:1]))
+
+        neighbors = {}
+        for a, b in self.connections:
+            neighbors.setdefault(a, []).append(b)
+            neighbors.setdefault(b, []).append(a)
+
+        # position of each cell in the path
+        position = {begin: 0}
+        prev, node = None, begin
+        while True:
+            moves = [n for n in neighbors.get(node, []) if n != prev]
+            if not moves:
+                break
+            if len(moves) > 1:
+                return ["the path branches at %s" % (node,)]
+
+            n = moves[0]
+            if n not in data:
+                return ["the path goes outside the grid at %s" % (n,)]
+            if n in position:
+                return ["the path has a loop at %s" % (n,)]
+
+            (y1, x1), (y2, x2) = node, n
+            if max(abs(y2-y1), abs(x2-x1)) != 1:
+                return ["%s is connected to %s, which is not next to it" % (node, n)]
+            if data[n] != next_value[data[node]]:
+                return ["%s is followed by %s at %s" % (data[node], data[n], n)]
+
+            p, q = (y2, x1), (y1, x2)
+            if x1 != x2 and y1 != y2 and p in position and q in position and abs(position[p] - position[q]) == 1:
+                return ["the path crosses itself between %s and %s" % (node, n)]
+
+            position[n] = len(position)
+            prev, node = node, n
+
+        problems = []
+        if node != end:
+            problems.append("the path ends at %s instead of %s" % (node, end))
+        if len(position) != len(data):
+            problems.append("the path covers %d of the %d cells" % (len(position), len(data)))
+        if len(self.connections) != len(position) - 1:
+            problems.append("there are connections that are not on the path")
+        return problems
+
 class TwistGenerator:
     def __init__(self, rows, cols, max):
         self.rows = rows
@@ -147,6 +273,8 @@ class TwistGenerator:
 def cross(A, B):
     return ((a, b) for a in A for b in B)
 
+ORDERS = ["fixed", "fewest"]
+
 class TwistSolver:
     """Twist Puzzle solver.
 
@@ -161,11 +289,28 @@ class TwistSolver:
         >>> s.next_value[2]
         1
         >>> s.graph
+
+    The moves from a cell are tried in one of the orders:
+
+        fixed   - the order of the neighbours, row by row
+        fewest  - the neighbour with the fewest onward moves first, as in
+                  Warnsdorff's rule for the knight's tour. The cells that
+                  are hard to reach are visited before their last way in is
+                  used up.
+
+    When a seed is given, the ties are broken at random, for restarts (see
+    search.run_restarts).
     """
-    def __init__(self, data):
+    def __init__(self, data, order="fixed", seed=None, value_order=None):
+        if order not in ORDERS:
+            raise ValueError("unknown order %r, expected one of %s" % (order, ", ".join(ORDERS)))
+        if value_order is not None:
+            raise ValueError("unknown value order %r, the moves of twist puzzles have no values to order" % value_order)
         if isinstance(data, list):
             data = utils.matrix2dict(data)
         self.data = data
+        self.order = order
+        self.random = seed is not None and random.Random(seed)
         self.rows = len(set(r for r, c in data))
         self.cols = len(set(c for r, c in data))
         self.values = sorted(set(data.values()))
@@ -186,15 +331,44 @@ class TwistSolver:
         return zip(nodelist, nodelist[1:])
 
     def solve(self):
-        for s in self._solve(self.graph, {}, self.begin):
-            nodes = [item[0] for item in sorted(s.items(), key=lambda item: item[1])]
-            connections = zip(nodes, nodes[1:])
-            yield TwistSolution(Twist(self.rows, self.cols, self.data), connections)
+        """Generates all the solutions.
+
+        The recursive search is faster than search.iterate, which is used
+        when the search has a budget or is to be resumed, but it nests a
+        generator for every cell of the path, so the large grids are
+        searched with search.iterate.
+        """
+        if len(self.graph) > sys.getrecursionlimit() // 2:
+            return search.iterate(self)
+        return (self.make_solution(visited) for visited in self._solve({}, self.begin))
+
+    def _solve(self, visited, node):
+        visited = visited.copy()
+        visited[node] = len(visited)
+
+        if node == self.end:
+            if len(visited) == len(self.graph):
+                yield visited
+            return
+
+        if self.order == "fixed" and not self.random:
+            # the moves are checked lazily, which is faster than next_nodes
+            for n in self.graph[node]:
+                if n not in visited and not self.are_crossing(n, node, visited):
+                    yield from self._solve(visited, n)
+        else:
+            for n in self.next_nodes(node, visited):
+                yield from self._solve(visited, n)
+
+    def make_solution(self, visited):
+        nodes = [item[0] for item in sorted(visited.items(), key=lambda item: item[1])]
+        connections = list(zip(nodes, nodes[1:]))
+        return TwistSolution(Twist(self.rows, self.cols, self.data), connections)
 
     def solve_one(self):
         s = self.solve()
         try:
-            return s.next()
+            return next(s)
         except StopIteration:
             return None
 
@@ -209,22 +383,264 @@ class TwistSolver:
             and p in visited and q in visited \
             and abs(visited[p] - visited[q]) == 1
 
-    def _solve(self, graph, visited, node):
-        if node in visited:
-            return
+    def root(self):
+        return [({}, self.begin)]
 
+    def expand(self, move):
+        """Moves to node from the path visited and returns (solution, moves)
+        for the new path.
+        """
+        visited, node = move
         visited = visited.copy()
         visited[node] = len(visited)
 
         if node == self.end:
-            if len(visited) == len(graph):
-                yield visited
-            return
+            if len(visited) == len(self.graph):
+                return visited, None
+            return None, None
+
+        if self.order == "fixed" and not self.random:
+            return None, [(visited, n) for n in self.graph[node]
+                          if n not in visited and not self.are_crossing(n, node, visited)]
+        return None, [(visited, n) for n in self.next_nodes(node, visited)]
+
+    def next_nodes(self, node, visited):
+        """Returns the cells the path visited can move to from node, in the order they are tried."""
+        nodes = [n for n in self.graph[node]
+                 if n not in visited and not self.are_crossing(n, node, visited)]
+        if self.random:
+            self.random.shuffle(nodes)
+        if self.order == "fewest":
+            nodes.sort(key=lambda n: self.onward_moves(n, visited))
+        return nodes
+
+    def onward_moves(self, node, visited):
+        """Returns the number of unvisited cells that can follow node."""
+        return sum(1 for n in self.graph[node] if n not in visited)
+
+class TwistCounter:
+    """Counts the solutions of a twist puzzle without enumerating them.
+
+    The number of ways to complete a path depends only on its head, the set
+    of visited cells and the diagonal moves that can still be crossed, so
+    the count is memoized on those. A diagonal move blocks the other
+    diagonal of its 2x2 square only while both cells of that diagonal are
+    unvisited or the head, so the other diagonals are kept in the key only
+    that long. The paths that leave some unvisited cells cut off from the
+    head are not followed. The counts are kept in a transposition table of
+    atmost max_entries entries, dropping the least recently used ones.
+
+    With the counts, a solution is sampled uniformly at random by picking
+    each move with the probability of the number of solutions through it.
+
+        >>> counter = Twist.loads("111\\n111\\n111").counter()
+        >>> counter.count()
+        8
+        >>> counter.sample(random.Random(1)).verify()
+        []
+    """
+    def __init__(self, solver, max_entries=2**20):
+        self.solver = solver
+        self.max_entries = max_entries
+        self.table = collections.OrderedDict()
+
+        self.cells = sorted(solver.graph)
+        index = dict((cell, i) for i, cell in enumerate(self.cells))
+        self.bits = [1 << i for i in range(len(self.cells))]
+        self.full = (1 << len(self.cells)) - 1
+        self.begin = index[solver.begin]
+        self.end = index[solver.end]
+        self.next = [[index[n] for n in solver.graph[cell]] for cell in self.cells]
+        # the cells connected to each cell by a move in either direction, as a bit mask
+        self.adjacent = [0] * len(self.cells)
+        for a, moves in enumerate(self.next):
+            for b in moves:
+                self.adjacent[a] |= self.bits[b]
+                self.adjacent[b] |= self.bits[a]
+
+        # the other diagonal of the square of every diagonal move, as a bit mask
+        self.other_diagonal = {}
+        for a, (y1, x1) in enumerate(self.cells):
+            for b in self.next[a]:
+                y2, x2 = self.cells[b]
+                if abs(x2-x1) == 1 and abs(y2-y1) == 1:
+                    p, q = index.get((y2, x1)), index.get((y1, x2))
+                    if p is not None and q is not None:
+                        self.other_diagonal[a, b] = self.bits[p] | self.bits[q]
+
+    def root(self):
+        return self.begin, self.bits[self.begin], frozenset()
+
+    def children(self, state):
+        """Returns the states after each move from the state."""
+        head, visited, blocked = state
+        children = []
+        for n in self.next[head]:
+            if visited & self.bits[n] or (self.bits[head] | self.bits[n]) in blocked:
+                continue
+            # the head is no longer the head, so the diagonals through it can't be used
+            done = visited
+            b = frozenset(d for d in blocked if not d & done)
+            other = self.other_diagonal.get((head, n))
+            if other is not None and not other & done:
+                b = b | {other}
+            children.append((n, visited | self.bits[n], b))
+        return children
+
+    def connected(self, state):
+        """Tells if the unvisited cells can all be reached from the head,
+        ignoring the directions of the moves.
+        """
+        head, visited, blocked = state
+        left = self.full & ~visited
+        reached = frontier = self.bits[head]
+        adjacent = self.adjacent
+        while frontier:
+            new = 0
+            while frontier:
+                low = frontier & -frontier
+                new |= adjacent[low.bit_length() - 1]
+                frontier ^= low
+            frontier = new & left & ~reached
+            reached |= frontier
+        return not left & ~reached
+
+    def terminal(self, state):
+        """Returns the count of a state at the end cell, None for other states."""
+        head, visited, blocked = state
+        if head == self.end:
+            return 1 if visited == self.full else 0
+        return None
+
+    def lookup(self, state):
+        count = self.table.get(state)
+        if count is not None:
+            self.table.move_to_end(state)
+        return count
+
+    def store(self, state, count):
+        self.table[state] = count
+        if len(self.table) > self.max_entries:
+            self.table.popitem(last=False)
+
+    def count(self, state=None):
+        """Returns the number of solutions, or of the ways to complete the path of the state."""
+        state = state or self.root()
+        count = self.terminal(state)
+        if count is None:
+            count = self.lookup(state)
+        if count is not None:
+            return count
+
+        # depth first, keeping a stack of [state, children left, count so far]
+        stack = [[state, self.children(state), 0]]
+        while True:
+            frame = stack[-1]
+            if frame[1]:
+                child = frame[1].pop()
+                count = self.terminal(child)
+                if count is None:
+                    count = self.lookup(child)
+                if count is None and not self.connected(child):
+                    count = 0
+                if count is None:
+                    stack.append([child, self.children(child), 0])
+                else:
+                    frame[2] += count
+                continue
+
+            stack.pop()
+            self.store(frame[0], frame[2])
+            if not stack:
+                return frame[2]
+            stack[-1][2] += frame[2]
+
+    def sample(self, random=random):
+        """Returns a solution chosen uniformly at random, or None if there are no solutions."""
+        state = self.root()
+        total = self.count(state)
+        if not total:
+            return None
 
-        for n in graph[node]:
-            if n not in visited and not self.are_crossing(n, node, visited):
-                for soln in self._solve(graph, visited, n):
-                    yield soln
+        path = [state[0]]
+        while self.terminal(state) is None:
+            r = random.randrange(total)
+            for child in self.children(state):
+                count = self.count(child)
+                if r < count:
+                    break
+                r -= count
+            state, total = child, count
+            path.append(state[0])
+        return self.solver.make_solution(dict((self.cells[n], i) for i, n in enumerate(path)))
+
+class IncrementalTwistSolver(search.IncrementalSolver):
+    """Re-solves a twist puzzle after a cell is edited.
+
+    Changing a cell changes only the moves from and to the cells around it,
+    so only those entries of the graph are recomputed. When the change only
+    removes moves and all the solutions are known, the solutions using the
+    removed moves are dropped instead of searching again.
+
+        >>> editor = Twist.loads("1223\\n3114\\n4212\\n3434").incremental()
+        >>> len(editor.solve())
+        1
+        >>> len(editor.set_cell(1, 1, "2"))
+        0
+        >>> len(editor.set_cell(1, 1, "1"))
+        1
+    """
+    def __init__(self, puzzle, limit=100):
+        search.IncrementalSolver.__init__(self, limit)
+        self.rows = puzzle.rows
+        self.cols = puzzle.cols
+        self.solver = TwistSolver(dict(puzzle.data))
+
+    def snapshot(self):
+        return tuple(sorted(self.solver.data.items()))
+
+    def search(self):
+        result = search.run(self.solver, limit=self.limit)
+        # the solutions share the data of the solver, which the next edit changes
+        puzzle = self.puzzle()
+        result.solutions = [TwistSolution(puzzle, s.connections) for s in result.solutions]
+        return result
+
+    def puzzle(self):
+        return Twist(self.rows, self.cols, dict(self.solver.data))
+
+    def rebuild(self, solution):
+        return TwistSolution(self.puzzle(), solution.connections)
+
+    def around(self, row, col):
+        return [n for n in cross([row-1, row, row+1], [col-1, col, col+1]) if n in self.solver.grid]
+
+    def moves(self, cells):
+        return set((a, b) for a in cells for b in self.solver.graph[a])
+
+    def set_cell(self, row, col, value):
+        solver = self.solver
+        value = str(value)
+        if solver.data[row, col] == value:
+            return self.solve()
+
+        cells = self.around(row, col)
+        old_moves = self.moves(cells)
+        solver.data[row, col] = value
+
+        if sorted(set(solver.data.values())) != solver.values:
+            # the digits have changed, and so has the cycle of next values
+            self.solver = TwistSolver(solver.data)
+            return self.update(False, None)
+
+        for n in cells:
+            solver.graph[n] = solver.get_next(*n)
+        removed_only = self.moves(cells) <= old_moves
+
+        region = set(cells)
+        def accept(s):
+            return all(b in solver.graph[a] for a, b in s.connections if a in region or b in region)
+        return self.update(removed_only, accept)
 
 parser.register_puzzle("twist", Twist)
 parser.register_puzzle("twist-solution", TwistSolution)
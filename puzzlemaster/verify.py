@@ -0,0 +1,78 @@
+"""Verifying solutions without solving the puzzles.
+
+A solution is verified by the verify method of its class, which returns the
+list of problems found in it. Many solutions can be verified as a stream of
+puzzle files, each starting with its "puzzle:" header, like the output of
+the solve command.
+
+    >>> list(verify_stream(["puzzle: twist-solution", "", "1-2", " /", "1-2",
+    ...                     "puzzle: twist-solution", "", "1-2", "  |", "1-2"]))
+    [(1, []), (6, ['2 is followed by 2 at (1, 1)'])]
+    >>> list(verify_stream(["puzzle: twist", "", "12", "21"]))
+    [(1, ["can't verify the solution: TypeError: Twist solutions can't be verified"])]
+"""
+from . import parser, profiling
+
+@profiling.timed("verify")
+def verify(puzzle):
+    """Returns the list of problems in the solution, which is empty when it is valid."""
+    if not hasattr(puzzle, "verify"):
+        raise TypeError("%s solutions can't be verified" % puzzle.__class__.__name__)
+    return puzzle.verify()
+
+def verify_file(filename):
+    return verify(parser.parse_file(filename))
+
+def split_documents(lines):
+    """Splits a stream of lines into puzzle files.
+
+    A puzzle file starts at a "puzzle:" header and ends at the blank line
+    after its grid, so the lines between the puzzle files, like the
+    "N solutions found" printed by the solve command, are skipped.
+    Generates (line number, text) for each puzzle file, with the line number
+    of its header starting from 1.
+
+        >>> list(split_documents(["puzzle: twist", "", "12", "", "2 solutions found"]))
+        [(1, 'puzzle: twist\\n\\n12')]
+    """
+    lineno, doc = 0, []
+    headers = body = False
+    for i, line in enumerate(lines, 1):
+        line = line.rstrip("\n")
+        if line.startswith("puzzle:"):
+            if doc:
+                yield lineno, "\n".join(doc)
+            lineno, doc = i, []
+            headers, body = True, False
+        elif not doc:
+            continue
+        elif line.strip():
+            body = not headers
+        elif headers:
+            headers = False
+        elif body:
+            yield lineno, "\n".join(doc)
+            doc = []
+            continue
+        doc.append(line)
+    if doc:
+        yield lineno, "\n".join(doc)
+
+def verify_stream(lines):
+    """Verifies each puzzle file in a stream of lines.
+
+    Generates (line number, problems) for each puzzle file. Only one puzzle
+    file is kept in memory at a time.
+    """
+    for lineno, text in split_documents(lines):
+        try:
+            puzzle = parser.parse(text)
+        except Exception as e:
+            yield lineno, ["can't parse the solution: %s: %s" % (e.__class__.__name__, e)]
+            continue
+
+        try:
+            problems = verify(puzzle)
+        except Exception as e:
+            problems = ["can't verify the solution: %s: %s" % (e.__class__.__name__, e)]
+        yield lineno, problems
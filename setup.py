@@ -8,6 +8,9 @@ setup(
     author_email='anandology@gmail.com',
     url=' http://anandology.github.com/puzzlemaster',
     packages=['puzzlemaster'],
+    extras_require={
+        'numpy': ['numpy'],
+    },
     license="",
     platforms=["any"],
     entry_points = {